@@ -0,0 +1,92 @@
+"""
+startup benchmark for `import mt5quant.quant`
+
+it runs `python -X importtime -c "import mt5quant.quant"` in a fresh process,
+and report the cumulative import time of mt5quant and the slowest modules.
+
+heavy modules (pandas, matplotlib, plotly) must not be loaded on import,
+they are imported inside the function which use them.
+numpy is not one of them, MetaTrader5 requires and imports numpy itself.
+
+usage:
+    python benchmark/import_time.py [--budget 150] [--repeat 5] [--top 10]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+HEAVY_MODULES = ("pandas", "matplotlib", "plotly")
+
+# import time:       self [us] |  cumulative | imported package
+_LINE_ = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def import_time(module="mt5quant.quant"):
+    """
+    :param module: the module to import, None means only start the interpreter
+    :return: list of (module, self us, cumulative us, depth)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "pass" if module is None else f"import {module}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=root,
+                            capture_output=True,
+                            text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = _LINE_.match(line)
+        if match is None:
+            continue
+
+        self_us, cumulative_us, indent, name = match.groups()
+        records.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="mt5quant.quant")
+    parser.add_argument("--budget", type=float, default=150, help="budget of cumulative import time in ms")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # modules imported by the interpreter itself (site, encodings...) are not count
+    startup = set(r[0] for r in import_time(None))
+
+    # the first run fill the disk cache and compile .pyc, so it is not count
+    import_time(args.module)
+
+    best = None
+    for _ in range(args.repeat):
+        records = [r for r in import_time(args.module) if r[0] not in startup]
+        total = sum(r[2] for r in records if r[3] == 0)
+        if best is None or total < best[0]:
+            best = (total, records)
+
+    total, records = best
+    print(f"import {args.module}: {total / 1000:.1f} ms (best of {args.repeat})")
+    for name, self_us, cumulative_us, _ in sorted(records, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"    {name:<40} self {self_us / 1000:8.2f} ms | cumulative {cumulative_us / 1000:8.2f} ms")
+
+    status = 0
+    loaded = [r[0] for r in records if r[0].split(".")[0] in HEAVY_MODULES]
+    if len(loaded) > 0:
+        print(f"heavy modules loaded on import: {', '.join(sorted(set(m.split('.')[0] for m in loaded)))}")
+        status = 1
+
+    if total / 1000 > args.budget:
+        print(f"over budget: {total / 1000:.1f} ms > {args.budget:.1f} ms")
+        status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import asyncio
+import inspect
+from abc import abstractmethod
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import MetaTrader5 as mt5
+
+from .quant import MT5Quant, STRATEGY_STATUES
+from .async_trade import AsyncTrade
+
+
+class AsyncMT5Quant(MT5Quant):
+    """
+    asyncio version of MT5Quant
+
+    OnTick is a coroutine and it's called with the symbol which has a new tick,
+    every symbol in symbols is watched, and the ticks of different symbols are processed concurrently.
+    if OnTick of a symbol is still running when its new tick comes, the tick is skipped,
+    OnTick will see the latest tick when it's called next time.
+    the ticks are polled in a thread of their own, so the polls never wait behind the orders,
+    and the threshold callbacks of monitor are sent back to the event loop, they can be coroutine functions.
+
+    self.trade is AsyncTrade, e.g.
+        await self.trade.buy_open(...)
+        await self.trade.gather(self.trade.set_pos("GOLD#", 0.1), self.trade.set_pos("EURUSD#", -0.1), timeout=5)
+    """
+
+    @abstractmethod
+    async def OnTick(self, symbol: str): ...
+
+    def __init__(self, *args, max_workers: int = 8, per_symbol: int = 1, poll_interval: float = 0.001, **kwargs):
+        """
+        :param max_workers: threads to run the blocking MetaTrader5 calls
+        :param per_symbol: max orders of one symbol running at the same time
+        :param poll_interval: max seconds between two polls of ticks, it's shorter if a timer is due
+        other parameters see MT5Quant
+        """
+        super().__init__(*args, poll_interval=poll_interval, **kwargs)
+        self.trade = AsyncTrade(self.trade, max_workers, per_symbol)
+        # the background tasks, e.g. coroutine timer callbacks, they are waited before shutdown
+        self._tasks_ = set()
+        self._poll_executor_ = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncMT5Quant-poll")
+
+    def run(self):
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        init_status = self.OnInit()
+        if not (init_status == 0 or init_status is None):
+            return init_status
+
+        # the timer callback can be a coroutine function
+        self.timers.on_awaitable = lambda aw: self._spawn_(self._await_(aw, "OnTimer"))
+
+        loop = asyncio.get_running_loop()
+        if self.monitor is not None:
+            self.monitor.dispatch = lambda *args: loop.call_soon_threadsafe(self._on_threshold_, *args)
+
+        symbols = tuple(self.symbols)
+        last_time = {}
+        running = {}
+        while self._STRATEGY_STATUE_ == STRATEGY_STATUES.OPEN:
+            self.timers.advance()
+
+            # the ticks are fetched and fed to risk and monitor in the poll thread, never block the event loop
+            new = await loop.run_in_executor(self._poll_executor_, self._poll_ticks_, symbols, last_time)
+            for symbol in new:
+                if symbol not in symbols:
+                    continue
+
+                # skip the symbol which OnTick is running
+                task = running.get(symbol)
+                if task is not None and not task.done():
+                    continue
+
+                running[symbol] = asyncio.create_task(self._on_tick_(symbol))
+
+            await asyncio.sleep(self._wait_time_())
+
+        # wait for the OnTick and the timer callbacks which are running, they may still send orders
+        while True:
+            pending = [task for task in running.values() if not task.done()] + list(self._tasks_)
+            if len(pending) <= 0:
+                break
+            await asyncio.wait(pending)
+
+        self.OnDeinit(self._STRATEGY_STATUE_)
+
+        if self.journal is not None:
+            self.journal.close()
+
+        self.trade.close()
+        self._poll_executor_.shutdown(wait=True)
+        if self.monitor is not None:
+            self.monitor.dispatch = None
+
+        # shut down connection to the MetaTrader 5 terminal
+        mt5.shutdown()
+        self.logger.info(
+            f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} shut down connection to the MetaTrader 5 terminal")
+
+    async def _on_tick_(self, symbol):
+        try:
+            await self.OnTick(symbol)
+        except Exception as e:
+            self.logger.exception(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} OnTick[{symbol}] failed: {e}")
+
+    def _spawn_(self, aw):
+        """
+        run aw in background, the task is kept until it's done
+        """
+        task = asyncio.ensure_future(aw)
+        self._tasks_.add(task)
+        task.add_done_callback(self._tasks_.discard)
+        return task
+
+    def _on_threshold_(self, callback, monitor, kind, value):
+        try:
+            result = callback(monitor, kind, value)
+            if inspect.isawaitable(result):
+                self._spawn_(self._await_(result, f"{kind} callback"))
+        except Exception as e:
+            self.logger.exception(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {kind} callback failed: {e}")
+
+    async def _await_(self, aw, name):
+        try:
+            await aw
+        except Exception as e:
+            self.logger.exception(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {name} failed: {e}")
@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from mt5quant.trade import Trade
+
+# key of the orders which may touch all symbols, e.g. buy_close(symbol=None),
+# they wait for the orders of every symbol and run alone
+ALL_SYMBOLS = "*"
+
+
+class _AllSymbolsLock:
+    """
+    reader/writer lock between the orders of one symbol (shared) and the orders of all symbols (exclusive)
+    the exclusive waiter holds the inner lock, so the new orders of one symbol wait behind it
+    """
+
+    def __init__(self):
+        self._lock_ = asyncio.Lock()
+        self._shared_ = 0
+        self._idle_ = asyncio.Event()
+        self._idle_.set()
+
+    @contextlib.asynccontextmanager
+    async def shared(self):
+        async with self._lock_:
+            self._shared_ += 1
+            self._idle_.clear()
+        try:
+            yield
+        finally:
+            self._shared_ -= 1
+            if self._shared_ == 0:
+                self._idle_.set()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        async with self._lock_:
+            await self._idle_.wait()
+            yield
+
+
+class AsyncTrade:
+    """
+    asyncio facade of Trade
+
+    the blocking MetaTrader5 calls run on a dedicated bounded thread pool,
+    so the event loop can process ticks and send other orders while waiting for the broker.
+    the orders of one symbol are limited by per_symbol (default 1, run one by one),
+    the orders of different symbols run concurrently,
+    the orders of all symbols (symbol=None) run alone, no order of any symbol overlaps them.
+
+    cancel (e.g. timeout of gather) only stop the orders which are not started,
+    the order which has been sent to terminal can not be cancelled, it's waited until done
+    and its real result is returned instead of CancelledError.
+    """
+
+    def __init__(self,
+                 trade: Trade,
+                 max_workers: int = 8,
+                 per_symbol: int = 1):
+        self.trade_tool = trade
+        self.logger = trade.logger
+        self.per_symbol = per_symbol
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AsyncTrade")
+        self._semaphores_ = {}
+        self._all_symbols_ = None
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def call(self, func, *args, **kwargs):
+        """
+        run a blocking function, e.g. mt5.symbol_info_tick, on the executor
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _run_(self, symbol, func, *args, **kwargs):
+        # created in the running event loop
+        if self._all_symbols_ is None:
+            self._all_symbols_ = _AllSymbolsLock()
+
+        if symbol is None:
+            async with self._all_symbols_.exclusive():
+                return await self._submit_(ALL_SYMBOLS, func, *args, **kwargs)
+
+        semaphore = self._semaphores_.get(symbol)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_symbol)
+            self._semaphores_[symbol] = semaphore
+
+        async with self._all_symbols_.shared(), semaphore:
+            return await self._submit_(symbol, func, *args, **kwargs)
+
+    async def _submit_(self, key, func, *args, **kwargs):
+        future = self.executor.submit(functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # the order is not started, it's never sent
+            if future.cancel():
+                raise
+
+            # the order has been running in terminal and can not be stopped,
+            # keep the symbol locked until it's done, so the orders of one symbol never overlap,
+            # and return its result, so the caller knows the order is sent
+            self.logger.warning(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                                f"Order[{key}] is cancelled after sent, wait for its result")
+            task = asyncio.current_task()
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            await asyncio.wait([asyncio.wrap_future(future)])
+            return future.result()
+
+    ###################### trade ######################
+    async def buy_open(self, symbol: str, lots: float, profit: float, stoploss: float,
+                       comment: str = "buy open", use_point: bool = True):
+        return await self._run_(symbol, self.trade_tool.buy_open,
+                                symbol, lots, profit, stoploss, comment, use_point)
+
+    async def sell_open(self, symbol: str, lots: float, profit: float, stoploss: float,
+                        comment: str = "sell open", use_point: bool = True):
+        return await self._run_(symbol, self.trade_tool.sell_open,
+                                symbol, lots, profit, stoploss, comment, use_point)
+
+    async def buy_close(self, comment: str = None, symbol: str = None, fuzzy: str = False, magic: bool = True):
+        return await self._run_(symbol, self.trade_tool.buy_close, comment, symbol, fuzzy, magic)
+
+    async def sell_close(self, comment: str = None, symbol: str = None, fuzzy: str = False):
+        return await self._run_(symbol, self.trade_tool.sell_close, comment, symbol, fuzzy)
+
+    async def trade(self, symbol, volume, reserved=False):
+        return await self._run_(symbol, self.trade_tool.trade, symbol, volume, reserved)
+
+    async def set_pos(self, symbol, volume, reserved=None):
+        return await self._run_(symbol, self.trade_tool.set_pos, symbol, volume, reserved)
+
+    async def set_pos_batch(self, positions: dict, timeout: float = None):
+        """
+        set the net position of many symbols concurrently, the risk is checked at once
+        :return: symbol -> result of trade, RISK_REJECT, or asyncio.TimeoutError if it's cancelled before sent
+        """
+        orders, res = await self.call(self.trade_tool.plan_pos_batch, positions)
+        symbols = list(orders.keys())
+        # the position is read again in the lock of symbol, see Trade.set_pos
+        results = await self.gather(*(self.set_pos(symbol, positions[symbol], orders[symbol]) for symbol in symbols),
+                                    timeout=timeout)
+        res.update(zip(symbols, results))
+
+        # the orders cancelled before sent give back their reserved risk
+        unsent = {symbol: orders[symbol] for symbol, result in zip(symbols, results)
+                  if isinstance(result, (asyncio.TimeoutError, asyncio.CancelledError))}
+        await self.call(self.trade_tool.release_orders, unsent)
+        return res
+
+    ###################### gather ######################
+    async def gather(self, *aws, timeout: float = None):
+        """
+        run many orders at once
+        :param timeout: seconds, the orders not started are cancelled,
+                        the orders which have been sent are waited and their results are kept
+        :return: list of result in order, the exception (e.g. asyncio.TimeoutError) instead of result if failed
+        """
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        if len(tasks) == 0:
+            return []
+
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+        if len(pending) > 0:
+            await asyncio.wait(pending)
+
+        res = []
+        for task in tasks:
+            if task.cancelled():
+                if task in pending:
+                    res.append(asyncio.TimeoutError(f"order is cancelled after {timeout} seconds"))
+                else:
+                    res.append(asyncio.CancelledError())
+            elif task.exception() is not None:
+                res.append(task.exception())
+            else:
+                res.append(task.result())
+
+        return res
@@ -0,0 +1,224 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import MetaTrader5 as mt5
+
+from mt5quant.error import DataMissingError
+
+# the fields of TradeDeal and TradeOrder, see
+# https://www.mql5.com/en/docs/python_metatrader5/mt5historydealsget_py
+# https://www.mql5.com/en/docs/python_metatrader5/mt5historyordersget_py
+DEAL_COLUMNS = (
+    ("ticket", "INTEGER PRIMARY KEY"), ("order", "INTEGER"), ("time", "INTEGER"), ("time_msc", "INTEGER"),
+    ("type", "INTEGER"), ("entry", "INTEGER"), ("magic", "INTEGER"), ("position_id", "INTEGER"),
+    ("reason", "INTEGER"), ("volume", "REAL"), ("price", "REAL"), ("commission", "REAL"),
+    ("swap", "REAL"), ("profit", "REAL"), ("fee", "REAL"), ("symbol", "TEXT"),
+    ("comment", "TEXT"), ("external_id", "TEXT"),
+)
+ORDER_COLUMNS = (
+    ("ticket", "INTEGER PRIMARY KEY"), ("time_setup", "INTEGER"), ("time_setup_msc", "INTEGER"),
+    ("time_done", "INTEGER"), ("time_done_msc", "INTEGER"), ("time_expiration", "INTEGER"),
+    ("type", "INTEGER"), ("type_time", "INTEGER"), ("type_filling", "INTEGER"), ("state", "INTEGER"),
+    ("magic", "INTEGER"), ("position_id", "INTEGER"), ("position_by_id", "INTEGER"), ("reason", "INTEGER"),
+    ("volume_initial", "REAL"), ("volume_current", "REAL"), ("price_open", "REAL"), ("sl", "REAL"),
+    ("tp", "REAL"), ("price_current", "REAL"), ("price_stoplimit", "REAL"), ("symbol", "TEXT"),
+    ("comment", "TEXT"), ("external_id", "TEXT"),
+)
+# table -> (columns, time column)
+TABLES = {
+    "deals": (DEAL_COLUMNS, "time"),
+    "orders": (ORDER_COLUMNS, "time_done"),
+}
+
+
+def _timestamp_(value):
+    """
+    the time of history is the trade server time, naive datetime is not converted by local time zone
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class HistorySync:
+    """
+    local store of history deals and orders, it's a sqlite database
+
+    sync fetch only the records newer than the last stored record from terminal
+    (with overlap seconds to catch the records of the same second), so it's cheap to call often.
+    deals, orders and the aggregates are served by the local database, they never touch the terminal.
+
+    time is the trade server time in seconds, like mt5.history_deals_get.
+    """
+
+    def __init__(self,
+                 path: str,
+                 start: datetime = datetime(2000, 1, 1),
+                 overlap: int = 3600,
+                 logger: logging.Logger = None):
+        """
+        :param path: sqlite database file
+        :param start: the first sync fetch the history from start
+        :param overlap: seconds fetched again before the last stored record
+        """
+        self.path = path
+        self.start = start
+        self.overlap = overlap
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        self._lock_ = threading.Lock()
+        self._db_ = sqlite3.connect(path, check_same_thread=False)
+        with self._db_:
+            for table, (columns, time_column) in TABLES.items():
+                fields = ", ".join(f'"{name}" {kind}' for name, kind in columns)
+                self._db_.execute(f"CREATE TABLE IF NOT EXISTS {table} ({fields})")
+                self._db_.execute(f"CREATE INDEX IF NOT EXISTS {table}_time ON {table} ({time_column})")
+                self._db_.execute(f"CREATE INDEX IF NOT EXISTS {table}_magic ON {table} (magic, {time_column})")
+                self._db_.execute(f"CREATE INDEX IF NOT EXISTS {table}_symbol ON {table} (symbol, {time_column})")
+
+    def close(self):
+        with self._lock_:
+            self._db_.close()
+
+    ###################### sync ######################
+    def cursor(self, table: str = "deals"):
+        """
+        :return: time of the last stored record, None if the table is empty
+        """
+        time_column = TABLES[table][1]
+        with self._lock_:
+            return self._db_.execute(f"SELECT MAX({time_column}) FROM {table}").fetchone()[0]
+
+    def sync(self) -> dict:
+        """
+        fetch the new deals and orders from terminal
+        :return: table -> number of records fetched
+        """
+        # the trade server time may be ahead of local time
+        date_to = datetime.now(timezone.utc) + timedelta(days=7)
+        res = {}
+        for table, fetch in (("deals", mt5.history_deals_get), ("orders", mt5.history_orders_get)):
+            last = self.cursor(table)
+            if last is None:
+                date_from = self.start
+            else:
+                date_from = datetime.fromtimestamp(max(last - self.overlap, 0), timezone.utc)
+
+            records = fetch(date_from, date_to)
+            if records is None:
+                raise DataMissingError(f"can not get history {table}, error code: {mt5.last_error()}")
+
+            self._insert_(table, records)
+            res[table] = len(records)
+
+        return res
+
+    def _insert_(self, table, records):
+        if len(records) <= 0:
+            return
+
+        columns = [name for name, _ in TABLES[table][0]]
+        fields = ", ".join(f'"{name}"' for name in columns)
+        values = ", ".join("?" for _ in columns)
+        with self._lock_, self._db_:
+            self._db_.executemany(f"INSERT OR REPLACE INTO {table} ({fields}) VALUES ({values})",
+                                  ([getattr(r, name) for name in columns] for r in records))
+
+    ###################### query ######################
+    def _select_(self, table, columns, start, end, symbol, magic, where=None):
+        time_column = TABLES[table][1]
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(f"{time_column} >= ?")
+            params.append(_timestamp_(start))
+        if end is not None:
+            conditions.append(f"{time_column} < ?")
+            params.append(_timestamp_(end))
+        if symbol is not None:
+            conditions.append("symbol = ?")
+            params.append(symbol)
+        if magic is not None:
+            conditions.append("magic = ?")
+            params.append(magic)
+        if where is not None:
+            conditions.append(where)
+
+        fields = ", ".join(f'"{name}"' for name in columns)
+        sql = f"SELECT {fields} FROM {table}"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {time_column}, ticket"
+
+        with self._lock_:
+            return self._db_.execute(sql, params).fetchall()
+
+    def _frame_(self, table, start, end, symbol, magic):
+        import pandas as pd
+
+        columns = [name for name, _ in TABLES[table][0]]
+        rows = self._select_(table, columns, start, end, symbol, magic)
+        return pd.DataFrame(rows, columns=columns)
+
+    def deals(self, start=None, end=None, symbol: str = None, magic: int = None):
+        """
+        history deals from local database
+        :param start: datetime or timestamp, include
+        :param end: datetime or timestamp, exclude
+        :return: DataFrame
+        """
+        return self._frame_("deals", start, end, symbol, magic)
+
+    def orders(self, start=None, end=None, symbol: str = None, magic: int = None):
+        """
+        history orders from local database, filtered by time_done
+        :return: DataFrame
+        """
+        return self._frame_("orders", start, end, symbol, magic)
+
+    def pnl_arrays(self, start=None, end=None, symbol: str = None, magic: int = None):
+        """
+        realized pnl (profit + commission + swap + fee) of trade deals
+        :return: (time array, magic array, symbol array, pnl array)
+        """
+        rows = self._select_("deals", ("time", "magic", "symbol", "profit", "commission", "swap", "fee"),
+                             start, end, symbol, magic,
+                             where=f"type IN ({mt5.DEAL_TYPE_BUY}, {mt5.DEAL_TYPE_SELL})")
+        n = len(rows)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), \
+                np.empty(0, dtype=object), np.empty(0, dtype=float)
+
+        times = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        magics = np.fromiter((r[1] for r in rows), dtype=np.int64, count=n)
+        symbols = np.array([r[2] for r in rows], dtype=object)
+        values = np.array([r[3:] for r in rows], dtype=float)
+        return times, magics, symbols, np.nan_to_num(values).sum(axis=1)
+
+    def pnl_per_magic_day(self, start=None, end=None, symbol: str = None, magic: int = None):
+        """
+        realized pnl per magic per day (trade server day)
+        :return: DataFrame, index is date, columns are magic
+        """
+        import pandas as pd
+
+        times, magics, _, pnl = self.pnl_arrays(start, end, symbol, magic)
+        if len(pnl) == 0:
+            return pd.DataFrame()
+
+        days, day_index = np.unique(times // 86400, return_inverse=True)
+        magic_values, magic_index = np.unique(magics, return_inverse=True)
+
+        table = np.zeros((len(days), len(magic_values)), dtype=float)
+        np.add.at(table, (day_index, magic_index), pnl)
+
+        return pd.DataFrame(table,
+                            index=pd.to_datetime(days * 86400, unit="s").date,
+                            columns=magic_values)
@@ -0,0 +1,512 @@
+import os
+import json
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# (column, dtype, the key in request dict or in the result of order_send)
+# symbol and comment are dictionary encoded, the dictionary is saved in the meta of segment
+REQUEST_COLUMNS = (
+    ("action",          "i4", "action"),
+    ("type",            "i4", "type"),
+    ("symbol",          "i4", "symbol"),
+    ("volume_request",  "f8", "volume"),
+    ("price_request",   "f8", "price"),
+    ("sl",              "f8", "sl"),
+    ("tp",              "f8", "tp"),
+    ("deviation",       "i4", "deviation"),
+    ("magic",           "i8", "magic"),
+    ("position",        "i8", "position"),
+    ("comment",         "i4", "comment"),
+)
+RESULT_COLUMNS = (
+    ("retcode",         "i4", "retcode"),
+    ("deal",            "i8", "deal"),
+    ("order",           "i8", "order"),
+    ("volume",          "f8", "volume"),
+    ("price",           "f8", "price"),
+    ("bid",             "f8", "bid"),
+    ("ask",             "f8", "ask"),
+)
+# time: the time order_send is called, timestamp in seconds
+# latency: the seconds order_send cost
+COLUMNS = (("time", "f8", None), ("latency", "f8", None)) + REQUEST_COLUMNS + RESULT_COLUMNS
+DICTIONARY_COLUMNS = ("symbol", "comment")
+DTYPES = {name: dtype for name, dtype, _ in COLUMNS}
+
+# retcode when order_send return None
+NO_RESULT = -1
+
+# segment -> meta of all segments, it's a cache so query doesn't open every meta.json
+MANIFEST = "manifest.json"
+
+
+def _timestamp_(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+
+class _Task:
+    """
+    a function run by the writer thread after the queued records are written
+    """
+    __slots__ = ("func", "args", "result", "error", "done")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TradeJournal:
+    """
+    append-only journal of every order_send, stored as columnar segments
+
+    record only put the request and result into a queue, a background thread
+    write them into a new segment every flush_size records or flush_interval seconds.
+    when there are compact_segments segments less than compact_rows, the writer merges them into one,
+    so a long running journal doesn't end up with thousands of small segments.
+
+    segment layout:
+        {path}/{segment}/{column}.npy   one numpy array per column
+        {path}/{segment}/meta.json      rows, min/max time and magic, symbol and comment dictionary,
+                                        and the segments it replaces if it's compacted
+        {path}/manifest.json            segment -> meta, the cache of all meta.json
+    a segment is written in a hidden directory and published by one rename, so it's never seen half written.
+    a compacted segment hides the segments it replaces, they are removed after it's published.
+
+    query load the columns by memory map, and skip the segments by the meta
+    without reading them, e.g. the segments out of time range or without the symbol.
+    """
+
+    def __init__(self,
+                 path: str,
+                 flush_size: int = 10000,
+                 flush_interval: float = 60.0,
+                 compact_segments: int = 64,
+                 compact_rows: int = 100000,
+                 logger: logging.Logger = None):
+        """
+        :param compact_segments: merge the small segments when there are so many of them, None to disable
+        :param compact_rows: the segment less than compact_rows is small
+        """
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.compact_segments = compact_segments
+        self.compact_rows = compact_rows
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        os.makedirs(path, exist_ok=True)
+
+        self._manifest_ = {}
+        # (mtime, size) of manifest.json when it's loaded or saved
+        self._manifest_stat_ = None
+        self._manifest_lock_ = threading.RLock()
+
+        self._queue_ = queue.SimpleQueue()
+        self._closed_ = False
+        # the items put after close are never run by the writer
+        self._put_lock_ = threading.Lock()
+        self._writer_ = threading.Thread(target=self._write_loop_, name="TradeJournal", daemon=True)
+        self._writer_.start()
+        atexit.register(self.close)
+
+    ###################### write ######################
+    def record(self, request: dict, result, start: float = None, latency: float = 0.0):
+        """
+        record one order_send, it's cheap and never block on disk
+        :param request: the request dict of order_send
+        :param result: the result of order_send, it can be None
+        :param start: timestamp when order_send is called, default now
+        :param latency: seconds order_send cost
+        """
+        if self._closed_:
+            return
+
+        if start is None:
+            start = time.time()
+
+        self._queue_.put((start, latency, request, result))
+
+    def flush(self):
+        """
+        write the queued records into a new segment, and wait until it's done
+        """
+        done = threading.Event()
+        with self._put_lock_:
+            if self._closed_:
+                return
+            self._queue_.put(done)
+        done.wait()
+
+    def close(self):
+        with self._put_lock_:
+            if self._closed_:
+                return
+            self._closed_ = True
+            self._queue_.put(None)
+        self._writer_.join()
+
+    def _write_loop_(self):
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue_.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = False
+
+            if isinstance(item, tuple):
+                rows.append(item)
+                if len(rows) < self.flush_size:
+                    continue
+
+            # flush when full, timeout, flush(), compact() or close()
+            if len(rows) > 0:
+                try:
+                    self._write_segment_(rows)
+                    self._auto_compact_()
+                except Exception as e:
+                    self.logger.error(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                                      f"journal write {len(rows)} records failed: {e}")
+                rows = []
+            deadline = time.monotonic() + self.flush_interval
+
+            if item is None:
+                return
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif isinstance(item, _Task):
+                item.run()
+
+    def _auto_compact_(self):
+        if self.compact_segments is None:
+            return
+
+        small = sum(1 for _, meta in self.segments() if meta["rows"] < self.compact_rows)
+        if small >= self.compact_segments:
+            self._compact_(self.compact_rows)
+
+    def _write_segment_(self, rows):
+        n = len(rows)
+        columns = {name: np.zeros(n, dtype=dtype) for name, dtype, _ in COLUMNS}
+        dictionary = {name: {} for name in DICTIONARY_COLUMNS}
+
+        for i, (start, latency, request, result) in enumerate(rows):
+            columns["time"][i] = start
+            columns["latency"][i] = latency
+
+            for name, _, key in REQUEST_COLUMNS:
+                value = request.get(key)
+                if name in DICTIONARY_COLUMNS:
+                    value = dictionary[name].setdefault(value or "", len(dictionary[name]))
+                if value is not None:
+                    columns[name][i] = value
+
+            if result is None:
+                columns["retcode"][i] = NO_RESULT
+                continue
+
+            for name, _, key in RESULT_COLUMNS:
+                columns[name][i] = getattr(result, key, 0)
+
+        self.write(columns, {name: list(values.keys()) for name, values in dictionary.items()})
+
+    def write(self, columns: dict, dictionary: dict, replaces: list = None):
+        """
+        write one segment
+        :param columns: column -> numpy array, symbol and comment are ids of dictionary
+        :param dictionary: symbol/comment -> list of string
+        :param replaces: the segments merged into this one, they are hidden once it's published
+        """
+        # segments are named by the first time, so they are sorted by time
+        segment = f"{int(columns['time'].min() * 1e6):020d}_{os.getpid()}_{time.time_ns()}"
+        tmp = os.path.join(self.path, f".{segment}.tmp")
+        os.makedirs(tmp)
+
+        for name, dtype, _ in COLUMNS:
+            np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(columns[name], dtype=dtype))
+
+        meta = {
+            "rows": int(len(columns["time"])),
+            "time": [float(columns["time"].min()), float(columns["time"].max())],
+            "magic": sorted(set(int(m) for m in np.unique(columns["magic"]))),
+            "symbol": dictionary["symbol"],
+            "comment": dictionary["comment"],
+        }
+        if replaces:
+            meta["replaces"] = list(replaces)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        # publish the segment and hide the replaced segments at once
+        os.rename(tmp, os.path.join(self.path, segment))
+
+        with self._manifest_lock_:
+            self._manifest_[segment] = meta
+            self._save_manifest_()
+
+        return segment
+
+    ###################### manifest ######################
+    def _load_manifest_(self):
+        """
+        reload manifest.json if it's changed, e.g. written by the journal of other process
+        """
+        path = os.path.join(self.path, MANIFEST)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+
+        if (stat.st_mtime_ns, stat.st_size) == self._manifest_stat_:
+            return
+
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        # the meta of a segment never changes, so the entries can be merged
+        self._manifest_.update(manifest)
+        self._manifest_stat_ = (stat.st_mtime_ns, stat.st_size)
+
+    def _save_manifest_(self):
+        path = os.path.join(self.path, MANIFEST)
+        tmp = os.path.join(self.path, f".{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._manifest_, f)
+        os.replace(tmp, path)
+
+        stat = os.stat(path)
+        self._manifest_stat_ = (stat.st_mtime_ns, stat.st_size)
+
+    def _read_meta_(self, segment):
+        try:
+            with open(os.path.join(self.path, segment, "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def _all_segments_(self):
+        """
+        :return: list of (segment, meta) on disk, including the replaced segments
+        """
+        with self._manifest_lock_:
+            self._load_manifest_()
+
+            res = []
+            for segment in sorted(os.listdir(self.path)):
+                # hidden: segments being written and the temp files
+                if segment.startswith(".") or segment == MANIFEST:
+                    continue
+
+                meta = self._manifest_.get(segment)
+                if meta is None:
+                    meta = self._read_meta_(segment)
+                    if meta is None:
+                        continue
+                    self._manifest_[segment] = meta
+                res.append((segment, meta))
+
+            # forget the removed segments
+            if len(self._manifest_) > len(res):
+                self._manifest_ = dict(res)
+
+        return res
+
+    ###################### read ######################
+    def segments(self):
+        """
+        :return: list of (segment, meta), sorted by time
+        """
+        res = self._all_segments_()
+        replaced = set()
+        for _, meta in res:
+            replaced.update(meta.get("replaces", ()))
+
+        return [(segment, meta) for segment, meta in res if segment not in replaced]
+
+    def query(self,
+              start=None,
+              end=None,
+              symbol: str = None,
+              magic: int = None,
+              columns=None,
+              as_frame: bool = False):
+        """
+        :param start: datetime or timestamp, include
+        :param end: datetime or timestamp, exclude
+        :param symbol:
+        :param magic:
+        :param columns: the columns to return, default all columns
+        :param as_frame: if True, return pandas DataFrame
+        :return: column -> numpy array, symbol and comment are decoded to string
+        """
+        # the segments may be removed by compact between listed and loaded, list them again
+        for retry in range(3):
+            try:
+                return self._query_(start, end, symbol, magic, columns, as_frame)
+            except FileNotFoundError:
+                if retry == 2:
+                    raise
+
+    def _query_(self, start, end, symbol, magic, columns, as_frame):
+        start = _timestamp_(start)
+        end = _timestamp_(end)
+        if columns is None:
+            columns = [name for name, _, _ in COLUMNS]
+
+        parts = {name: [] for name in columns}
+        times = []
+        for segment, meta in self.segments():
+            # skip segment by meta
+            t_min, t_max = meta["time"]
+            if start is not None and t_max < start:
+                continue
+            if end is not None and t_min >= end:
+                continue
+            if magic is not None and magic not in meta["magic"]:
+                continue
+            if symbol is not None and symbol not in meta["symbol"]:
+                continue
+
+            directory = os.path.join(self.path, segment)
+            load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+            mask = None
+            if start is not None and t_min < start:
+                mask = load("time") >= start
+            if end is not None and t_max >= end:
+                mask = (load("time") < end) if mask is None else mask & (load("time") < end)
+            if magic is not None and len(meta["magic"]) > 1:
+                m = load("magic") == magic
+                mask = m if mask is None else mask & m
+            if symbol is not None and len(meta["symbol"]) > 1:
+                m = load("symbol") == meta["symbol"].index(symbol)
+                mask = m if mask is None else mask & m
+
+            t = load("time")
+            times.append(np.array(t if mask is None else t[mask]))
+
+            for name in columns:
+                values = load(name)
+                values = np.array(values if mask is None else values[mask])
+                if name in DICTIONARY_COLUMNS:
+                    values = np.array(meta[name], dtype=object)[values]
+                parts[name].append(values)
+
+        res = {}
+        for name in columns:
+            if len(parts[name]) > 0:
+                res[name] = np.concatenate(parts[name])
+            else:
+                res[name] = np.empty(0, dtype=object if name in DICTIONARY_COLUMNS else DTYPES[name])
+
+        # segments written by different processes may overlap in time
+        if len(times) > 1:
+            times = np.concatenate(times)
+            if np.any(times[1:] < times[:-1]):
+                order = np.argsort(times, kind="stable")
+                res = {name: values[order] for name, values in res.items()}
+
+        if as_frame:
+            import pandas as pd
+
+            res = pd.DataFrame(res, columns=columns)
+            if "time" in res:
+                res["time"] = pd.to_datetime(res["time"], unit="s")
+
+        return res
+
+    def compact(self, min_rows: int = 100000):
+        """
+        merge the segments which rows less than min_rows into one segment,
+        it's run by the writer thread after the queued records are written
+        :return: the merged segment, None if nothing to merge
+        """
+        task = _Task(self._compact_, min_rows)
+        with self._put_lock_:
+            if not self._closed_:
+                self._queue_.put(task)
+                return task.wait()
+
+        return self._compact_(min_rows)
+
+    def _compact_(self, min_rows):
+        # the segments left by a compact which failed before removing them
+        self._remove_replaced_()
+
+        small = [(segment, meta) for segment, meta in self.segments() if meta["rows"] < min_rows]
+        if len(small) <= 1:
+            return None
+
+        columns = {}
+        dictionary = {name: {} for name in DICTIONARY_COLUMNS}
+        for name, dtype, _ in COLUMNS:
+            values = []
+            for segment, meta in small:
+                value = np.load(os.path.join(self.path, segment, f"{name}.npy"))
+                if name in DICTIONARY_COLUMNS:
+                    # re-encode by the merged dictionary
+                    ids = [dictionary[name].setdefault(s, len(dictionary[name])) for s in meta[name]]
+                    value = np.array(ids, dtype=dtype)[value]
+                values.append(value)
+            columns[name] = np.concatenate(values)
+
+        # keep the records sorted by time
+        order = np.argsort(columns["time"], kind="stable")
+        columns = {name: values[order] for name, values in columns.items()}
+        segment = self.write(columns, {name: list(values.keys()) for name, values in dictionary.items()},
+                             replaces=[old for old, _ in small])
+        self._remove_replaced_()
+
+        return segment
+
+    def _remove_replaced_(self):
+        """
+        remove the segments replaced by a compacted segment, they are hidden since it's published
+        """
+        res = self._all_segments_()
+        replaced = set()
+        for _, meta in res:
+            replaced.update(meta.get("replaces", ()))
+
+        removed = [segment for segment, _ in res if segment in replaced]
+        if len(removed) == 0:
+            return
+
+        with self._manifest_lock_:
+            for segment in removed:
+                shutil.rmtree(os.path.join(self.path, segment), ignore_errors=True)
+                self._manifest_.pop(segment, None)
+            self._save_manifest_()
@@ -0,0 +1,334 @@
+import time
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+import MetaTrader5 as mt5
+
+from mt5quant.error import DataMissingError
+from mt5quant.risk import _locked_
+
+
+class _SymbolBook:
+    """
+    open positions of one symbol, stored in numpy arrays
+
+    the sum of volume and volume * price_open of buy and sell are kept,
+    so revalue by a tick is O(1) and doesn't depend on the size of the book
+    """
+    __slots__ = ("symbol", "ticket", "sign", "volume", "price_open", "signature",
+                 "swap", "point_value", "contract_size", "net",
+                 "buy_volume", "buy_cost", "sell_volume", "sell_cost",
+                 "bid", "ask", "pnl", "exposure")
+
+    def __init__(self, symbol, positions, symbol_info):
+        n = len(positions)
+        self.symbol = symbol
+        self.ticket = np.fromiter((p.ticket for p in positions), dtype=np.int64, count=n)
+        self.sign = np.fromiter((1.0 if p.type == mt5.POSITION_TYPE_BUY else -1.0 for p in positions),
+                                dtype=float, count=n)
+        self.volume = np.fromiter((p.volume for p in positions), dtype=float, count=n)
+        self.price_open = np.fromiter((p.price_open for p in positions), dtype=float, count=n)
+        self.signature = _signature_(positions)
+        self.swap = float(sum(p.swap for p in positions))
+
+        # profit of 1 lot when price move 1.0
+        self.point_value = symbol_info.trade_tick_value / symbol_info.trade_tick_size
+        self.contract_size = symbol_info.trade_contract_size
+
+        buy = self.sign > 0
+        self.buy_volume = float(self.volume[buy].sum())
+        self.buy_cost = float(np.dot(self.volume[buy], self.price_open[buy]))
+        self.sell_volume = float(self.volume[~buy].sum())
+        self.sell_cost = float(np.dot(self.volume[~buy], self.price_open[~buy]))
+        self.net = self.buy_volume - self.sell_volume
+
+        self.bid = symbol_info.bid
+        self.ask = symbol_info.ask
+        self.pnl = 0.0
+        self.exposure = 0.0
+
+    def revalue(self, bid, ask):
+        """
+        buy positions are closed at bid, sell positions are closed at ask
+        """
+        self.bid = bid
+        self.ask = ask
+        self.pnl = ((bid * self.buy_volume - self.buy_cost) + (self.sell_cost - ask * self.sell_volume)) \
+            * self.point_value + self.swap
+        self.exposure = self.net * self.contract_size * (bid + ask) / 2
+        return self.pnl
+
+    def position_pnl(self):
+        price = np.where(self.sign > 0, self.bid, self.ask)
+        return (price - self.price_open) * self.sign * self.volume * self.point_value
+
+
+def _signature_(positions):
+    return tuple(sorted((p.ticket, p.volume) for p in positions))
+
+
+class PositionMonitor:
+    """
+    streaming mark-to-market of the open positions
+
+    positions are loaded by refresh and kept in numpy arrays per symbol,
+    on_tick revalue the positions of the ticked symbol only, so it's cheap in every tick.
+    refresh_if_due reload the book from terminal every refresh_interval seconds, it's called by
+    the loop of MT5Quant out of on_tick, and only the symbols which positions have changed are rebuilt.
+    Trade call refresh(symbol) after its order is filled, so the own orders are seen at once.
+
+    thresholds:
+        drawdown:   (peak equity - equity) / peak equity >= limit
+        loss:       -unrealized pnl >= limit
+        exposure:   absolute exposure (net lots * contract size * price) >= limit
+    callback(monitor, kind, value) is called once when the threshold is crossed,
+    and it's called again only after the value is back under limit and cross it again.
+    it's called by dispatch(callback, monitor, kind, value) if dispatch is set,
+    e.g. AsyncMT5Quant send it to the event loop, because the ticks are polled in a worker thread.
+    """
+
+    KINDS = ("drawdown", "loss", "exposure")
+
+    def __init__(self,
+                 magic: int = 0,
+                 refresh_interval: float = 5.0,
+                 logger: logging.Logger = None):
+        self._MAGIC_ = magic
+        self.refresh_interval = refresh_interval
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        # refresh may be called by Trade in the threads of AsyncTrade
+        self._lock_ = threading.RLock()
+
+        self._books_ = {}
+        self._symbol_info_ = {}
+        self._refresh_time_ = None
+
+        self.balance = 0.0
+        self.total_pnl = 0.0
+        self.total_exposure = 0.0
+        self.peak_equity = None
+
+        # global thresholds are checked in every tick,
+        # symbol thresholds are checked only when the symbol ticks
+        self._thresholds_ = []
+        self._symbol_thresholds_ = {}
+        # None: the callback is called in the thread of on_tick
+        self.dispatch = None
+
+    @property
+    def equity(self):
+        return self.balance + self.total_pnl
+
+    @property
+    def drawdown(self):
+        if not self.peak_equity:
+            return 0.0
+        return max(self.peak_equity - self.equity, 0.0) / self.peak_equity
+
+    def pnl(self, symbol: str = None) -> float:
+        """
+        unrealized pnl (include swap) of symbol, or all symbols if symbol is None
+        """
+        if symbol is None:
+            return self.total_pnl
+
+        book = self._books_.get(symbol)
+        return 0.0 if book is None else book.pnl
+
+    def exposure(self, symbol: str = None) -> float:
+        """
+        signed exposure (net lots * contract size * mid price) of symbol,
+        or the sum of absolute exposure of all symbols if symbol is None
+        """
+        if symbol is None:
+            return self.total_exposure
+
+        book = self._books_.get(symbol)
+        return 0.0 if book is None else book.exposure
+
+    def positions(self, symbol: str):
+        """
+        :return: (ticket array, unrealized pnl array) of the positions of symbol
+        """
+        book = self._books_.get(symbol)
+        if book is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+
+        return book.ticket, book.position_pnl()
+
+    def symbols(self):
+        return list(self._books_.keys())
+
+    ###################### refresh ######################
+    def refresh_if_due(self) -> bool:
+        """
+        reload all positions if refresh_interval seconds have passed since the last refresh
+        :return: True if refreshed
+        """
+        if self._refresh_time_ is not None and time.monotonic() - self._refresh_time_ <= self.refresh_interval:
+            return False
+
+        self.refresh()
+        return True
+
+    @_locked_
+    def refresh(self, symbol: str = None):
+        """
+        reload the positions from terminal,
+        if symbol is set, only reload the positions of symbol
+        """
+        # balance changes when a position is closed
+        account = mt5.account_info()
+        if account is None:
+            raise DataMissingError(f"can not find account info, error code: {mt5.last_error()}")
+        self.balance = account.balance
+
+        if symbol is None:
+            pos = mt5.positions_get()
+        else:
+            pos = mt5.positions_get(symbol=symbol)
+
+        # group by symbol
+        groups = {}
+        for item_pos in pos or ():
+            if self._MAGIC_ != 0 and item_pos.magic != self._MAGIC_:
+                continue
+            groups.setdefault(item_pos.symbol, []).append(item_pos)
+
+        if symbol is None:
+            for closed in set(self._books_) - set(groups):
+                self._remove_(closed)
+            self._refresh_time_ = time.monotonic()
+        elif symbol not in groups and symbol in self._books_:
+            self._remove_(symbol)
+
+        for name, positions in groups.items():
+            book = self._books_.get(name)
+            if book is not None and book.signature == _signature_(positions):
+                # same positions, only swap may change
+                book.swap = float(sum(p.swap for p in positions))
+                bid, ask = book.bid, book.ask
+            else:
+                book = _SymbolBook(name, positions, self._info_(name))
+                bid, ask = book.bid, book.ask
+
+            # mark to market by the latest tick, the symbol may have no tick since last refresh
+            tick = mt5.symbol_info_tick(name)
+            if tick is not None:
+                bid, ask = tick.bid, tick.ask
+
+            self._revalue_(name, book, bid, ask)
+
+        if self.peak_equity is None or self.equity > self.peak_equity:
+            self.peak_equity = self.equity
+
+    def _info_(self, symbol):
+        info = self._symbol_info_.get(symbol)
+        if info is None:
+            info = mt5.symbol_info(symbol)
+            if info is None:
+                raise DataMissingError(f"can not find {symbol} info")
+            self._symbol_info_[symbol] = info
+
+        return info
+
+    def _remove_(self, symbol):
+        book = self._books_.pop(symbol)
+        self.total_pnl -= book.pnl
+        self.total_exposure -= abs(book.exposure)
+
+    def _revalue_(self, symbol, book, bid, ask):
+        old = self._books_.get(symbol)
+        if old is not None:
+            self.total_pnl -= old.pnl
+            self.total_exposure -= abs(old.exposure)
+
+        book.revalue(bid, ask)
+        self._books_[symbol] = book
+        self.total_pnl += book.pnl
+        self.total_exposure += abs(book.exposure)
+
+    ###################### tick ######################
+    @_locked_
+    def on_tick(self, symbol: str, tick=None):
+        """
+        revalue the positions of symbol by its tick, and check the thresholds
+        :param tick: the tick of symbol, if None, get it by mt5.symbol_info_tick
+        """
+        book = self._books_.get(symbol)
+        if book is not None:
+            if tick is None:
+                tick = mt5.symbol_info_tick(symbol)
+                if tick is None:
+                    raise DataMissingError(f"can not find {symbol} tick")
+
+            self._revalue_(symbol, book, tick.bid, tick.ask)
+
+        equity = self.equity
+        if self.peak_equity is None or equity > self.peak_equity:
+            self.peak_equity = equity
+
+        for threshold in self._thresholds_:
+            self._check_(threshold)
+
+        for threshold in self._symbol_thresholds_.get(symbol, ()):
+            self._check_(threshold)
+
+    ###################### threshold ######################
+    def add_threshold(self, kind: str, limit: float, callback, symbol: str = None):
+        """
+        :param kind: drawdown, loss or exposure
+        :param limit: drawdown is a ratio, e.g. 0.1 means 10% from peak equity
+        :param callback: callback(monitor, kind, value)
+        :param symbol: only for loss and exposure, None means all symbols
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}")
+
+        if kind == "drawdown" and symbol is not None:
+            raise ValueError("drawdown threshold can not set symbol")
+
+        # [kind, limit, callback, symbol, armed]
+        threshold = [kind, limit, callback, symbol, True]
+        if symbol is None:
+            self._thresholds_.append(threshold)
+        else:
+            self._symbol_thresholds_.setdefault(symbol, []).append(threshold)
+
+        return threshold
+
+    def remove_threshold(self, threshold):
+        if threshold[3] is None:
+            self._thresholds_.remove(threshold)
+        else:
+            self._symbol_thresholds_[threshold[3]].remove(threshold)
+
+    def _check_(self, threshold):
+        kind, limit, callback, symbol, armed = threshold
+        if kind == "drawdown":
+            value = self.drawdown
+        elif kind == "loss":
+            value = -self.pnl(symbol)
+        else:
+            value = abs(self.exposure(symbol))
+
+        if value < limit:
+            threshold[4] = True
+            return
+
+        if not armed:
+            return
+
+        threshold[4] = False
+        self.logger.warning(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                            f"{kind}{'' if symbol is None else f'[{symbol}]'} {value:.4f} >= {limit}")
+        if self.dispatch is None:
+            callback(self, kind, value)
+        else:
+            self.dispatch(callback, self, kind, value)
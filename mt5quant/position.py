@@ -1,6 +1,5 @@
 import copy
 
-import pandas as pd
 import MetaTrader5 as mt5
 
 
@@ -10,6 +9,8 @@ def get_net_pos(test=False):
     :param magic: see https://www.mql5.com/en/forum/263565
     :return:
     """
+    import pandas as pd
+
     # fetch position info
     # columns:
     #   type:
@@ -45,6 +46,8 @@ def get_net_pos(test=False):
 
 
 def get_ticket(test=False) -> list:
+    import pandas as pd
+
     pos = mt5.positions_get()
     if pos is None or len(pos) <= 0:
         return []
@@ -59,6 +62,8 @@ def get_ticket(test=False) -> list:
 
 
 def get_pos(test=False):
+    import pandas as pd
+
     pos = mt5.positions_get()
     if pos is None or len(pos) <= 0:
         return pd.DataFrame(columns=["ticket", "symbol", "type", "volume"]), pd.DataFrame(columns=["volume"])
@@ -1,14 +1,21 @@
+import time
 import signal
 import logging
 from datetime import datetime
 
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Union, Iterable
+from typing import TYPE_CHECKING, Union, Iterable
 
 import MetaTrader5 as mt5
 
 from .trade import Trade
+from .risk import RiskEngine
+from .monitor import PositionMonitor
+from .timer import TimerWheel
+
+if TYPE_CHECKING:
+    from .journal import TradeJournal
 
 
 class STRATEGY_STATUES(Enum):
@@ -25,6 +32,8 @@ class MT5Quant(ABC):
     @abstractmethod
     def OnTick(self): ...
 
+    def OnTimer(self) -> None: ...
+
     def __init__(self,  symbols: Union[str, Iterable] = None,
                         account=None,
                         password=None,
@@ -32,7 +41,11 @@ class MT5Quant(ABC):
                         magic=0,
                         slippage=88,
                         logfile=None,
-                        MT5Path=None):
+                        MT5Path=None,
+                        risk: Union[RiskEngine, dict] = None,
+                        monitor: Union[PositionMonitor, dict, bool] = None,
+                        journal: Union["TradeJournal", str] = None,
+                        poll_interval: float = 0.001):
         # logging config
         logging.basicConfig(
             level=logging.DEBUG,
@@ -54,6 +67,13 @@ class MT5Quant(ABC):
         # init STRATEGY STATUE
         self._STRATEGY_STATUE_ = STRATEGY_STATUES.OPEN
 
+        # init timers, they are run in the loop of self.run, even there is no tick
+        # e.g. self.timers.every(60, callback), self.timers.cron("55 23 * * 1-5", callback)
+        self.timers = TimerWheel(logger=self.logger)
+        self._ON_TIMER_ = None
+        # max seconds between two polls of ticks, the loop wakes up earlier for the next timer
+        self.poll_interval = poll_interval
+
         # establish connection to the MetaTrader 5 terminal
         self.logger.info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} establish connection to the MetaTrader 5 terminal")
         if MT5Path is not None:     initial_result = mt5.initialize(path=MT5Path)
@@ -89,11 +109,82 @@ class MT5Quant(ABC):
         # initial trade tool
         self._MAGIC_ = magic
         self._SLIPPAGE_ = slippage
-        self.trade = Trade(magic, slippage, self.logger)
+        # initial pre-trade risk engine, it can be a RiskEngine or the limits dict of RiskEngine
+        if isinstance(risk, dict):
+            risk = RiskEngine(magic, logger=self.logger, **risk)
+        self.risk = risk
+
+        # initial trade journal, it can be a TradeJournal or the directory of journal
+        if isinstance(journal, str):
+            from .journal import TradeJournal
+
+            journal = TradeJournal(journal, logger=self.logger)
+        self.journal = journal
+
+        # initial position monitor, it's revalued by every tick before OnTick
+        # it can be a PositionMonitor, True, or the config dict of PositionMonitor
+        if monitor is True:
+            monitor = PositionMonitor(magic, logger=self.logger)
+        elif isinstance(monitor, dict):
+            monitor = PositionMonitor(magic, logger=self.logger, **monitor)
+        elif monitor is False:
+            monitor = None
+        self.monitor = monitor
+        self.trade = Trade(magic, slippage, self.logger, risk, journal, monitor)
 
     def signal_handler(self, sig, frame):
         self._STRATEGY_STATUE_ = STRATEGY_STATUES.CLOSE
 
+    def EventSetTimer(self, seconds: float):
+        """
+        run self.OnTimer every seconds, like EventSetTimer in MQL5
+        """
+        self.EventKillTimer()
+        self._ON_TIMER_ = self.timers.every(seconds, self.OnTimer)
+
+    def EventKillTimer(self):
+        if self._ON_TIMER_ is not None:
+            self._ON_TIMER_.cancel()
+            self._ON_TIMER_ = None
+
+    def _poll_ticks_(self, symbols, last_time: dict):
+        """
+        fetch the ticks of symbols and the other symbols in monitor's book,
+        the new ticks are fed to risk and monitor, so every book is marked to market by its own tick
+        :param last_time: symbol -> time_msc of the last tick fed, it's updated
+        :return: the symbols which have a new tick
+        """
+        if self.monitor is not None:
+            self.monitor.refresh_if_due()
+            symbols = list(symbols)
+            symbols += [symbol for symbol in self.monitor.symbols() if symbol not in symbols]
+
+        new = []
+        for symbol in symbols:
+            tick = mt5.symbol_info_tick(symbol)
+            if tick is None or tick.time_msc == last_time.get(symbol):
+                continue
+            last_time[symbol] = tick.time_msc
+            new.append(symbol)
+
+            if self.risk is not None:
+                self.risk.update_price(symbol, tick.bid, tick.ask)
+            if self.monitor is not None:
+                self.monitor.on_tick(symbol, tick)
+
+        return new
+
+    def _wait_time_(self):
+        """
+        seconds to wait before the next poll, the shorter of poll_interval and the next timer
+        """
+        wait = self.poll_interval
+        deadline = self.timers.next_deadline()
+        if deadline is not None:
+            wait = min(wait, max(deadline - time.time(), 0.0))
+
+        return wait
+
     def run(self):
         init_status = self.OnInit()
         if not (init_status == 0 or init_status is None):
@@ -101,22 +192,24 @@ class MT5Quant(ABC):
 
         # check STRATEGY STATUE, if open run continue, else close
         # this statue will change by ctrl+c in terminal, or may be change by other reason in future
-        last_tick = mt5.symbol_info_tick(self.symbols[0])
-        last_time = last_tick.time
-        last_time = None
+        # OnTick is called by the new tick of the first symbol,
+        # the ticks of the other symbols in monitor's book only revalue it
+        symbol = next(iter(self.symbols))
+        last_time = {}
         while self._STRATEGY_STATUE_ == STRATEGY_STATUES.OPEN:
-            last_tick = mt5.symbol_info_tick(self.symbols[0])
-            if last_tick.time == last_time:
-                continue
-            last_time = last_tick.time
+            self.timers.advance()
 
-            # log print
-            # self.logger.info(f"{self.symbols[0]}: {last_tick}")
+            if symbol not in self._poll_ticks_((symbol,), last_time):
+                time.sleep(self._wait_time_())
+                continue
 
             self.OnTick()
 
         self.OnDeinit(self._STRATEGY_STATUE_)
 
+        if self.journal is not None:
+            self.journal.close()
+
         # shut down connection to the MetaTrader 5 terminal
         mt5.shutdown()
         self.logger.info(
@@ -1,6 +1,3 @@
-import MetaTrader5 as mt5
-import pandas as pd
-
 from .position import get_net_pos, get_pos
 
 
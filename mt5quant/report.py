@@ -0,0 +1,378 @@
+import logging
+
+import numpy as np
+
+# mt5.DEAL_TYPE_BUY and mt5.DEAL_TYPE_SELL, the report doesn't import MetaTrader5,
+# so it can be built from a history database on a machine without the terminal
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+
+# points of equity processed at once, the drawdown of a long series is never held in full
+CHUNK = 1 << 20
+
+
+###################### downsample ######################
+def _as_float_(x):
+    """
+    time array (datetime64 or timestamp) to float seconds
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64) / 1e9
+    return x.astype(float, copy=False)
+
+
+def minmax(x, y, n: int):
+    """
+    keep the min and max point of n / 2 buckets, it keeps the peaks and the troughs
+    :return: index of the kept points, sorted
+    """
+    size = len(y)
+    buckets = n // 2
+    if size <= n or buckets <= 0:
+        return np.arange(size)
+
+    m = size // buckets
+    body = np.asarray(y[:m * buckets]).reshape(buckets, m)
+    offset = np.arange(buckets) * m
+    index = [np.array([0, size - 1]), offset + body.argmin(axis=1), offset + body.argmax(axis=1)]
+
+    # the tail which is not full
+    if m * buckets < size:
+        tail = np.asarray(y[m * buckets:])
+        index.append(np.array([m * buckets + tail.argmin(), m * buckets + tail.argmax()]))
+
+    return np.unique(np.concatenate(index))
+
+
+def lttb(x, y, n: int):
+    """
+    largest triangle three buckets, it keeps the visual shape of the series
+    see https://skemman.is/handle/1946/15343
+    :return: index of the kept points, sorted
+    """
+    size = len(y)
+    if size <= n or n < 3:
+        return np.arange(size)
+
+    x = _as_float_(x)
+    y = np.asarray(y, dtype=float)
+
+    # n - 2 buckets between the first and the last point
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    index = np.empty(n, dtype=np.int64)
+    index[0] = 0
+    index[-1] = size - 1
+
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        if start >= end:
+            index[i + 1] = a
+            continue
+
+        # average point of the next bucket
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < n - 1 else size
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        index[i + 1] = a
+
+    return np.unique(index)
+
+
+def downsample(x, y, n: int = 2000, method: str = "minmaxlttb"):
+    """
+    downsample a series before plotting
+    :param method:
+        minmax:     min and max of buckets, fully vectorized
+        lttb:       largest triangle three buckets
+        minmaxlttb: minmax to 4 * n points first, then lttb, it's fast for millions of points
+    :return: (x, y) of the kept points
+    """
+    if method == "minmax":
+        index = minmax(x, y, n)
+    elif method == "lttb":
+        index = lttb(x, y, n)
+    elif method == "minmaxlttb":
+        index = minmax(x, y, n * 4)
+        if len(index) > n:
+            index = index[lttb(np.asarray(x)[index], np.asarray(y)[index], n)]
+    else:
+        raise ValueError(f"unknown downsample method: {method}")
+
+    return np.asarray(x)[index], np.asarray(y)[index]
+
+
+###################### metrics ######################
+def drawdown(equity):
+    """
+    :return: (drawdown, drawdown ratio) from the peak equity, both are <= 0
+    """
+    equity = np.asarray(equity, dtype=float)
+    peak = np.maximum.accumulate(equity)
+    dd = equity - peak
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(peak > 0, dd / peak, 0.0)
+    return dd, ratio
+
+
+def iter_drawdown(equity, chunk: int = CHUNK):
+    """
+    drawdown chunk by chunk, the peak is carried to the next chunk,
+    so a memory mapped series of any length only needs the memory of one chunk
+    :return: iterator of (start, drawdown, drawdown ratio) of every chunk, see drawdown
+    """
+    peak = -np.inf
+    for start in range(0, len(equity), chunk):
+        values = np.asarray(equity[start:start + chunk], dtype=float)
+        running = np.maximum.accumulate(values)
+        np.maximum(running, peak, out=running)
+        peak = running[-1]
+
+        dd = values - running
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(running > 0, dd / running, 0.0)
+        yield start, dd, ratio
+
+
+def max_drawdown(equity, chunk: int = CHUNK):
+    """
+    :return: (max drawdown, max drawdown ratio), both are <= 0
+    """
+    max_dd, max_ratio = 0.0, 0.0
+    for _, dd, ratio in iter_drawdown(equity, chunk):
+        max_dd = min(max_dd, float(dd.min()))
+        max_ratio = min(max_ratio, float(ratio.min()))
+    return max_dd, max_ratio
+
+
+def equity_metrics(equity, max_dd: float = None, max_ratio: float = None) -> dict:
+    """
+    :param max_dd, max_ratio: the result of max_drawdown(equity), it's computed if None
+    """
+    equity = np.asarray(equity)
+    if len(equity) == 0:
+        return {"points": 0}
+
+    if max_dd is None or max_ratio is None:
+        max_dd, max_ratio = max_drawdown(equity)
+    return {
+        "points": len(equity),
+        "start": float(equity[0]),
+        "end": float(equity[-1]),
+        "pnl": float(equity[-1] - equity[0]),
+        "return": float(equity[-1] / equity[0] - 1) if equity[0] > 0 else np.nan,
+        "max_drawdown": float(max_dd),
+        "max_drawdown_ratio": float(max_ratio),
+        "peak": float(equity.max()),
+    }
+
+
+def _to_datetime_(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x
+    return (x * 1e3).astype(np.int64).astype("datetime64[ms]")
+
+
+class PerformanceReport:
+    """
+    equity, drawdown, exposure and per-strategy pnl report
+
+    the metrics are computed on the full series, but only the downsampled series are kept,
+    so the memory and the size of html are bounded by points no matter how long the series are.
+    the series can be memory mapped numpy arrays, e.g. the output of backtest,
+    the drawdown is computed and downsampled chunk by chunk, it's never held in full.
+
+    example:
+        report = PerformanceReport.from_history(HistorySync("history.db"), balance=10000)
+        report.add_equity("backtest", time, equity)
+        report.to_html("report.html")
+    """
+
+    def __init__(self,
+                 points: int = 2000,
+                 method: str = "minmaxlttb",
+                 chunk: int = CHUNK,
+                 logger: logging.Logger = None):
+        """
+        :param points: max points of each series in chart
+        :param method: see downsample
+        :param chunk: points of equity processed at once
+        """
+        self.points = points
+        self.method = method
+        self.chunk = chunk
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        # name -> (time, value) downsampled
+        self._equity_ = {}
+        self._drawdown_ = {}
+        self._exposure_ = {}
+        # name -> metrics dict
+        self.stats = {}
+
+    def add_equity(self, name, time, equity):
+        """
+        :param time: timestamp in seconds or datetime64 array
+        :param equity: equity array, the same length of time
+        """
+        time = np.asarray(time)
+        equity = np.asarray(equity)
+        size = len(equity)
+
+        # the drawdown is cut into minmax buckets of m points, the chunks hold whole buckets,
+        # so only the candidates of every chunk are kept, the same as minmax on the full series
+        n = self.points if self.method == "minmax" else self.points * 4
+        m = max(size // max(n // 2, 1), 1)
+        chunk = max(self.chunk // m, 1) * m
+
+        max_dd, max_ratio = 0.0, 0.0
+        index, values = [], []
+        for start, dd, ratio in iter_drawdown(equity, chunk):
+            max_dd = min(max_dd, float(dd.min()))
+            max_ratio = min(max_ratio, float(ratio.min()))
+            if size <= chunk:
+                # one chunk, downsample it as it is
+                self._drawdown_[name] = downsample(time, ratio, self.points, self.method)
+                continue
+
+            kept = minmax(None, ratio, 2 * max(len(ratio) // m, 1))
+            index.append(start + kept)
+            values.append(ratio[kept])
+
+        if size > chunk:
+            # minmax keep the troughs of drawdown
+            index = np.concatenate(index)
+            values = np.concatenate(values)
+            if self.method != "minmax" and len(index) > self.points:
+                kept = lttb(time[index], values, self.points)
+                index, values = index[kept], values[kept]
+            self._drawdown_[name] = (time[index], values)
+        elif size == 0:
+            self._drawdown_[name] = (time, np.empty(0, dtype=float))
+
+        self.stats[name] = equity_metrics(equity, max_dd, max_ratio)
+        self._equity_[name] = downsample(time, equity, self.points, self.method)
+
+    def add_pnl(self, name, time, pnl, balance: float = 0.0):
+        """
+        equity from the realized pnl of every deal, it starts from balance at the first deal
+        """
+        time = np.asarray(time)
+        if len(time) == 0:
+            return
+
+        equity = np.concatenate(([balance], balance + np.cumsum(np.asarray(pnl, dtype=float))))
+        self.add_equity(name, np.concatenate((time[:1], time)), equity)
+
+    def add_exposure(self, name, time, exposure):
+        self._exposure_[name] = downsample(time, np.asarray(exposure, dtype=float), self.points, self.method)
+
+    @classmethod
+    def from_history(cls, history, start=None, end=None, balance: float = 0.0, **kwargs):
+        """
+        report of every magic from HistorySync, the equity is balance + realized pnl
+        and the exposure is the sum of absolute net lots of all symbols
+        """
+        report = cls(**kwargs)
+
+        deals = history.deals(start, end)
+        deals = deals[deals["type"].isin([DEAL_TYPE_BUY, DEAL_TYPE_SELL])]
+        if len(deals) == 0:
+            return report
+
+        times = deals["time"].to_numpy(dtype=float)
+        magics = deals["magic"].to_numpy()
+        pnl = deals[["profit", "commission", "swap", "fee"]].fillna(0).to_numpy(dtype=float).sum(axis=1)
+        signed = np.where(deals["type"].to_numpy() == DEAL_TYPE_BUY, 1.0, -1.0) * deals["volume"].to_numpy(dtype=float)
+        _, symbol_ids = np.unique(deals["symbol"].to_numpy(dtype=str), return_inverse=True)
+
+        for magic in np.unique(magics):
+            mask = magics == magic
+            report.add_pnl(int(magic), times[mask], pnl[mask], balance)
+            report.add_exposure(int(magic), times[mask], _gross_lots_(symbol_ids[mask], signed[mask]))
+
+        return report
+
+    def metrics(self):
+        """
+        :return: DataFrame of metrics, index is the name of series
+        """
+        import pandas as pd
+
+        return pd.DataFrame.from_dict(self.stats, orient="index")
+
+    ###################### render ######################
+    def figure(self):
+        """
+        :return: plotly figure
+        """
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        fig = make_subplots(rows=4, cols=1, shared_xaxes=False, vertical_spacing=0.06,
+                            row_heights=[0.4, 0.2, 0.2, 0.2],
+                            subplot_titles=("equity", "drawdown", "exposure", "pnl"))
+
+        for row, series in ((1, self._equity_), (2, self._drawdown_), (3, self._exposure_)):
+            for name, (x, y) in series.items():
+                fig.add_trace(go.Scattergl(x=_to_datetime_(x), y=y, name=str(name), legendgroup=str(name),
+                                           showlegend=row == 1, mode="lines"),
+                              row=row, col=1)
+
+        names = [str(name) for name in self.stats]
+        fig.add_trace(go.Bar(x=names, y=[self.stats[name].get("pnl", 0) for name in self.stats],
+                             name="pnl", showlegend=False),
+                      row=4, col=1)
+
+        fig.update_yaxes(tickformat=".1%", row=2, col=1)
+        fig.update_layout(height=1200, hovermode="x unified")
+        return fig
+
+    def to_html(self, path: str, include_plotlyjs="cdn"):
+        """
+        write the interactive html report
+        :param include_plotlyjs: "cdn" make a small file, True make a file can be opened offline
+        """
+        self.figure().write_html(path, include_plotlyjs=include_plotlyjs)
+        return path
+
+    def plot(self):
+        """
+        :return: matplotlib figure
+        """
+        import matplotlib.pyplot as plt
+
+        fig, axes = plt.subplots(4, 1, figsize=(12, 12))
+        for ax, title, series in zip(axes, ("equity", "drawdown", "exposure"),
+                                     (self._equity_, self._drawdown_, self._exposure_)):
+            for name, (x, y) in series.items():
+                ax.plot(_to_datetime_(x), y, label=str(name), linewidth=0.8)
+            ax.set_title(title)
+
+        axes[0].legend(loc="upper left")
+        names = [str(name) for name in self.stats]
+        axes[3].bar(names, [self.stats[name].get("pnl", 0) for name in self.stats])
+        axes[3].set_title("pnl")
+        fig.tight_layout()
+        return fig
+
+
+def _gross_lots_(symbol_ids, signed):
+    """
+    sum of absolute net lots of all symbols after every deal
+    """
+    delta = np.zeros(len(signed), dtype=float)
+    for symbol in np.unique(symbol_ids):
+        mask = symbol_ids == symbol
+        gross = np.abs(np.cumsum(signed[mask]))
+        delta[mask] = np.diff(gross, prepend=0.0)
+    return np.cumsum(delta)
@@ -0,0 +1,470 @@
+import time
+import logging
+import functools
+import threading
+from datetime import datetime
+
+import numpy as np
+import MetaTrader5 as mt5
+
+from mt5quant.error import DataMissingError
+
+# return code of Trade when the order is rejected by RiskEngine,
+# the rejected order is never sent to the terminal
+RISK_REJECT = -3
+
+
+def _locked_(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock_:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class RiskEngine:
+    """
+    pre-trade risk check, it's done locally before mt5.order_send
+
+    account info, symbol contract data and the net position of magic are cached in numpy arrays
+    (one row per symbol), margin is calculated by mt5.order_calc_margin only when the cache miss
+    (or the price has moved more than price_tolerance), else it's scaled locally.
+    so check_batch is vectorized over the rows of the orders.
+
+    volume is signed like Trade.trade:
+        more than 0: buy volume
+        less than 0: sell volume
+    the order which only reduce the net position is always allowed.
+
+    check(reserve=True) applies the allowed order to the cached position at once,
+    so the orders checked at the same time (e.g. by AsyncTrade) see each other,
+    release gives the reservation back if the order is not filled.
+
+    per-magic limits:
+        max_lots:           max absolute net lots of one symbol
+        max_notional:       max sum of absolute notional (lots * contract size * price) of all symbols
+        max_margin:         max sum of margin of all symbols
+    per-account limits:
+        max_margin_ratio:   max (margin + new margin) / equity
+        min_free_margin:    min free margin left after the order
+    None means no limit.
+    """
+
+    def __init__(self,
+                 magic: int = 0,
+                 max_lots: float = None,
+                 max_notional: float = None,
+                 max_margin: float = None,
+                 max_margin_ratio: float = None,
+                 min_free_margin: float = None,
+                 ttl: float = 1.0,
+                 price_tolerance: float = 0.01,
+                 logger: logging.Logger = None):
+        self._MAGIC_ = magic
+        self.max_lots = max_lots
+        self.max_notional = max_notional
+        self.max_margin = max_margin
+        self.max_margin_ratio = max_margin_ratio
+        self.min_free_margin = min_free_margin
+
+        # account info and position will be reload after ttl seconds
+        self.ttl = ttl
+        self.price_tolerance = price_tolerance
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        # the cache may be used by many threads, e.g. AsyncTrade
+        self._lock_ = threading.RLock()
+
+        # symbol -> row of the arrays below
+        self._index_ = {}
+        self._symbols_ = []
+        # contract size, bid and ask of every symbol
+        self._contract_ = np.zeros(0)
+        self._bid_ = np.zeros(0)
+        self._ask_ = np.zeros(0)
+        # margin of 1 lot and the price it's calculated at, column 0 is buy, column 1 is sell
+        self._margin_lot_ = np.zeros((0, 2))
+        self._margin_price_ = np.zeros((0, 2))
+
+        # net position of magic, signed lots / notional / margin of every symbol
+        self._lots_ = np.zeros(0)
+        self._notional_ = np.zeros(0)
+        self._margin_ = np.zeros(0)
+        self._total_notional_ = 0.0
+        self._total_margin_ = 0.0
+        # symbol -> signed lots reserved by check and not released yet
+        self._reserved_ = {}
+
+        self._account_ = None
+        self._account_time_ = None
+        # margin of the orders filled after the last refresh, account_info doesn't include them
+        self._pending_margin_ = 0.0
+
+    ###################### cache ######################
+    @_locked_
+    def refresh(self):
+        """
+        reload account info and the net position of magic from terminal,
+        the prices are not reloaded here, they are kept by update_price
+        """
+        account = mt5.account_info()
+        if account is None:
+            raise DataMissingError(f"can not find account info, error code: {mt5.last_error()}")
+
+        lots = {}
+        pos = mt5.positions_get()
+        for item_pos in pos or ():
+            if self._MAGIC_ != 0 and item_pos.magic != self._MAGIC_:
+                continue
+
+            volume = item_pos.volume if item_pos.type == mt5.POSITION_TYPE_BUY else -item_pos.volume
+            lots[item_pos.symbol] = lots.get(item_pos.symbol, 0.0) + volume
+
+        self._account_ = account
+        self._account_time_ = time.monotonic()
+        self._pending_margin_ = 0.0
+
+        self._lots_[:] = 0.0
+        self._notional_[:] = 0.0
+        self._margin_[:] = 0.0
+        self._total_notional_ = 0.0
+        self._total_margin_ = 0.0
+        for symbol, volume in lots.items():
+            self._set_lots_(self._row_(symbol), volume)
+
+        # the reserved orders are not in positions until they are filled
+        for symbol, reserved in self._reserved_.items():
+            self._apply_(self._row_(symbol), sum(reserved))
+
+    def invalidate(self):
+        """
+        the cached account info and position will be reload in next check
+        """
+        self._account_time_ = None
+
+    @_locked_
+    def update_price(self, symbol, bid, ask):
+        """
+        update the cached price of symbol, it's called by MT5Quant with every new tick
+        of the polled symbols, so check never need to fetch the price from terminal
+        """
+        row = self._row_(symbol)
+        self._bid_[row] = bid
+        self._ask_[row] = ask
+
+    def lots(self, symbol: str) -> float:
+        """
+        cached net lots of magic, include the reserved orders
+        """
+        row = self._index_.get(symbol)
+        return 0.0 if row is None else float(self._lots_[row])
+
+    def _fresh_(self):
+        if self._account_time_ is None or time.monotonic() - self._account_time_ > self.ttl:
+            self.refresh()
+
+    def _row_(self, symbol):
+        row = self._index_.get(symbol)
+        if row is None:
+            symbol_info = mt5.symbol_info(symbol)
+            if symbol_info is None:
+                raise DataMissingError(f"can not find {symbol} info")
+
+            row = len(self._symbols_)
+            self._index_[symbol] = row
+            self._symbols_.append(symbol)
+            self._contract_ = np.append(self._contract_, symbol_info.trade_contract_size)
+            self._bid_ = np.append(self._bid_, symbol_info.bid)
+            self._ask_ = np.append(self._ask_, symbol_info.ask)
+            self._margin_lot_ = np.append(self._margin_lot_, [[0.0, 0.0]], axis=0)
+            self._margin_price_ = np.append(self._margin_price_, [[np.nan, np.nan]], axis=0)
+            self._lots_ = np.append(self._lots_, 0.0)
+            self._notional_ = np.append(self._notional_, 0.0)
+            self._margin_ = np.append(self._margin_, 0.0)
+
+        return row
+
+    def _rows_(self, symbols):
+        return np.fromiter((self._row_(symbol) for symbol in symbols), dtype=np.int64, count=len(symbols))
+
+    def _calc_margin_(self, row, side, price):
+        order_type = mt5.ORDER_TYPE_BUY if side == 0 else mt5.ORDER_TYPE_SELL
+        symbol = self._symbols_[row]
+        margin = mt5.order_calc_margin(order_type, symbol, 1.0, float(price))
+        if margin is None:
+            raise DataMissingError(f"can not calculate {symbol} margin, error code: {mt5.last_error()}")
+
+        self._margin_lot_[row, side] = margin
+        self._margin_price_[row, side] = price
+
+    def _margin_lots_(self, rows, volumes, prices):
+        """
+        vectorized margin of 1 lot of signed volumes at prices,
+        mt5.order_calc_margin is called only for the rows which cache miss
+        """
+        sides = np.where(volumes > 0, 0, 1)
+        cached = self._margin_price_[rows, sides]
+        # nan (never calculated) is missed too
+        missed = ~(np.abs(prices - cached) <= cached * self.price_tolerance) & (volumes != 0)
+        for i in np.flatnonzero(missed):
+            self._calc_margin_(rows[i], sides[i], prices[i])
+
+        cached = self._margin_price_[rows, sides]
+        lot = self._margin_lot_[rows, sides]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(cached > 0, lot * prices / cached, lot)
+
+    def _prices_(self, rows, volumes, prices=None):
+        """
+        the given prices, the missing (None) ones are the cached ask for buy and bid for sell
+        """
+        cached = np.where(volumes > 0, self._ask_[rows], self._bid_[rows])
+        if prices is None:
+            return cached
+
+        prices = np.array([np.nan if p is None else p for p in prices], dtype=float)
+        return np.where(np.isnan(prices), cached, prices)
+
+    def margin(self, symbol: str, volume: float, price: float = None) -> float:
+        """
+        margin of signed volume, mt5.order_calc_margin is called only when the cache miss
+        """
+        if volume == 0:
+            return 0.0
+
+        row = self._row_(symbol)
+        side = 0 if volume > 0 else 1
+        if price is None:
+            price = self._ask_[row] if volume > 0 else self._bid_[row]
+
+        cached = self._margin_price_[row, side]
+        if not abs(price - cached) <= cached * self.price_tolerance:
+            self._calc_margin_(row, side, price)
+            cached = price
+
+        margin = self._margin_lot_[row, side] * abs(volume)
+        if cached > 0:
+            return float(margin * price / cached)
+
+        return float(margin)
+
+    def notional(self, symbol: str, volume: float, price: float = None) -> float:
+        """
+        absolute notional of signed volume: lots * contract size * price
+        """
+        row = self._row_(symbol)
+        if price is None:
+            price = self._ask_[row] if volume > 0 else self._bid_[row]
+
+        return float(abs(volume) * self._contract_[row] * price)
+
+    def _set_lots_(self, row, volume, price=None):
+        symbol = self._symbols_[row]
+        notional = self.notional(symbol, volume, price)
+        margin = self.margin(symbol, volume, price)
+
+        self._total_notional_ += notional - self._notional_[row]
+        self._total_margin_ += margin - self._margin_[row]
+        self._lots_[row] = volume
+        self._notional_[row] = notional
+        self._margin_[row] = margin
+
+    def _apply_(self, row, volume, price=None):
+        old_margin = self._margin_[row]
+        self._set_lots_(row, self._lots_[row] + volume, price)
+        self._pending_margin_ += self._margin_[row] - old_margin
+
+    @_locked_
+    def on_fill(self, symbol: str, volume: float, price: float = None):
+        """
+        update the cached position after the order is filled,
+        so the next check needn't reload position from terminal
+        """
+        self._apply_(self._row_(symbol), volume, price)
+
+    def _reserve_(self, symbol, volume, price=None):
+        self._apply_(self._row_(symbol), volume, price)
+        self._reserved_.setdefault(symbol, []).append(volume)
+
+    @_locked_
+    def release(self, symbol: str, volume: float, filled: bool, price: float = None):
+        """
+        call it after the order checked by check(reserve=True) or check_batch(reserve=True) is sent
+        :param filled: True if the order is filled, the reserved lots become the position,
+                       else they are given back and the cache will be reload in next check
+        """
+        reserved = self._reserved_.get(symbol)
+        if reserved is not None and volume in reserved:
+            reserved.remove(volume)
+            if len(reserved) == 0:
+                del self._reserved_[symbol]
+
+            if not filled:
+                self._apply_(self._row_(symbol), -volume)
+                self.invalidate()
+            return
+
+        # the order which only reduce the position is not reserved
+        if filled:
+            self._apply_(self._row_(symbol), volume, price)
+        else:
+            self.invalidate()
+
+    ###################### check ######################
+    def _limit_reason_(self, notional, margin, account_margin):
+        """
+        :param notional: total notional of magic after the order
+        :param margin: total margin of magic after the order
+        :param account_margin: margin of account after the order
+        :return: the reason if a limit is broken, else None
+        """
+        account = self._account_
+        if self.max_notional is not None and notional > self.max_notional:
+            return f"notional {notional:.2f} > {self.max_notional}"
+
+        if self.max_margin is not None and margin > self.max_margin:
+            return f"margin {margin:.2f} > {self.max_margin}"
+
+        if self.max_margin_ratio is not None and account_margin > account.equity * self.max_margin_ratio:
+            return f"account margin {account_margin:.2f} > {self.max_margin_ratio} * equity {account.equity}"
+
+        if self.min_free_margin is not None and account.equity - account_margin < self.min_free_margin:
+            return f"free margin {account.equity - account_margin:.2f} < {self.min_free_margin}"
+
+        return None
+
+    def _over_limit_(self, notional, margin, account_margin):
+        """
+        vectorized _limit_reason_
+        :return: bool array, True if a limit is broken
+        """
+        account = self._account_
+        broken = np.zeros(len(notional), dtype=bool)
+        if self.max_notional is not None:
+            broken |= notional > self.max_notional
+        if self.max_margin is not None:
+            broken |= margin > self.max_margin
+        if self.max_margin_ratio is not None:
+            broken |= account_margin > account.equity * self.max_margin_ratio
+        if self.min_free_margin is not None:
+            broken |= account.equity - account_margin < self.min_free_margin
+
+        return broken
+
+    @_locked_
+    def check(self, symbol: str, volume: float, price: float = None, reserve: bool = False) -> bool:
+        """
+        :param symbol:
+        :param volume: signed volume, more than 0 means buy, less than 0 means sell
+        :param price: the price to send, if None use the cached price
+        :param reserve: if True, the allowed order is reserved until release is called
+        :return: True if the order is allowed
+        """
+        self._fresh_()
+
+        row = self._row_(symbol)
+        current = float(self._lots_[row])
+        new = current + volume
+
+        # the order only reduce the position
+        if abs(new) <= abs(current):
+            return True
+
+        d_notional = self.notional(symbol, new, price) - self._notional_[row]
+        d_margin = self.margin(symbol, new, price) - self._margin_[row]
+
+        if self.max_lots is not None and abs(new) > self.max_lots:
+            reason = f"lots {abs(new)} > {self.max_lots}"
+        else:
+            reason = self._limit_reason_(self._total_notional_ + d_notional,
+                                         self._total_margin_ + d_margin,
+                                         self._account_.margin + self._pending_margin_ + d_margin)
+
+        if reason is not None:
+            self.logger.warning(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} Order[{symbol}] {volume} lots "
+                                f"is rejected by risk: {reason}")
+            return False
+
+        if reserve:
+            self._reserve_(symbol, volume, price)
+
+        return True
+
+    @_locked_
+    def check_batch(self, symbols, volumes, prices=None, reserve: bool = False):
+        """
+        vectorized check for many orders, e.g. set the position of a portfolio
+
+        the per-magic and per-account limits are checked cumulatively in the order of symbols,
+        an order is allowed if it fits with the orders allowed before it,
+        so the total of all allowed orders is still in limits.
+        :param symbols: list of symbol, each symbol should appear once
+        :param volumes: list of signed volume
+        :param prices: list of price, if None use the cached price
+        :param reserve: if True, the allowed orders are reserved until release is called
+        :return: numpy bool array, True if the order is allowed
+        """
+        self._fresh_()
+
+        rows = self._rows_(symbols)
+        volumes = np.asarray(volumes, dtype=float)
+        current = self._lots_[rows]
+        new = current + volumes
+
+        # notional and margin of the new positions, margin of 1 lot comes from cache
+        prices = self._prices_(rows, new, prices)
+        new_notional = np.abs(new) * self._contract_[rows] * prices
+        new_margin = np.abs(new) * self._margin_lots_(rows, new, prices)
+        d_notional = new_notional - self._notional_[rows]
+        d_margin = new_margin - self._margin_[rows]
+
+        reducing = np.abs(new) <= np.abs(current)
+        ok = np.ones(len(rows), dtype=bool)
+        if self.max_lots is not None:
+            ok &= np.abs(new) <= self.max_lots
+
+        # cumulative limits, the orders are accepted one by one in order,
+        # and only the increase of risk of the accepted orders is added to the totals
+        increase = np.flatnonzero(ok & ~reducing)
+        account_margin = self._account_.margin + self._pending_margin_
+        notional = self._total_notional_ + np.cumsum(d_notional[increase])
+        margin = self._total_margin_ + np.cumsum(d_margin[increase])
+        broken = self._over_limit_(notional, margin, account_margin + margin - self._total_margin_)
+        if broken.any():
+            # the orders before the first broken one are accepted at once, the rest one by one
+            first = int(np.argmax(broken))
+            notional = self._total_notional_ + d_notional[increase[:first]].sum()
+            margin = self._total_margin_ + d_margin[increase[:first]].sum()
+            account_margin += margin - self._total_margin_
+            for i in increase[first:]:
+                if self._limit_reason_(notional + d_notional[i], margin + d_margin[i],
+                                       account_margin + d_margin[i]) is not None:
+                    ok[i] = False
+                    continue
+
+                notional += d_notional[i]
+                margin += d_margin[i]
+                account_margin += d_margin[i]
+
+        if reserve:
+            accepted = increase[ok[increase]]
+            accepted_rows = rows[accepted]
+            self._lots_[accepted_rows] = new[accepted]
+            self._notional_[accepted_rows] = new_notional[accepted]
+            self._margin_[accepted_rows] = new_margin[accepted]
+            self._total_notional_ += d_notional[accepted].sum()
+            self._total_margin_ += d_margin[accepted].sum()
+            self._pending_margin_ += d_margin[accepted].sum()
+            for i in accepted:
+                self._reserved_.setdefault(symbols[i], []).append(float(volumes[i]))
+
+        ok |= reducing
+        for i in np.flatnonzero(~ok):
+            self.logger.warning(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} Order[{symbols[i]}] "
+                                f"{volumes[i]} lots is rejected by risk")
+
+        return ok
@@ -0,0 +1,357 @@
+import math
+import time
+import inspect
+import logging
+from datetime import datetime, timedelta
+
+
+class Timer:
+    """
+    a timer registered in TimerWheel, keep it to cancel the timer
+    """
+    __slots__ = ("deadline", "tick", "callback", "interval", "period", "offset", "cron", "cancelled")
+
+    def __init__(self, deadline, callback, interval=None, period=None, offset=0.0, cron=None):
+        # timestamp to run the callback
+        self.deadline = deadline
+        self.tick = None
+        self.callback = callback
+        # periodic: run every interval seconds
+        self.interval = interval
+        # bar aligned: run at every multiple of period seconds (+ offset)
+        self.period = period
+        self.offset = offset
+        # cron-like: parsed cron expression
+        self.cron = cron
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def next_deadline(self, now):
+        """
+        the next deadline after now, None for one-shot timer
+        the late runs are merged into one, so a busy loop never run a timer many times at once
+        """
+        if self.interval is not None:
+            deadline = self.deadline + self.interval
+            if deadline <= now:
+                deadline += math.ceil((now - deadline) / self.interval + 1e-9) * self.interval
+            return deadline
+
+        if self.period is not None:
+            return _next_bar_(now, self.period, self.offset)
+
+        if self.cron is not None:
+            return self.cron.next(now)
+
+        return None
+
+
+def _next_bar_(now, period, offset):
+    return (math.floor((now - offset) / period) + 1) * period + offset
+
+
+class Cron:
+    """
+    cron expression: "minute hour day month weekday", in local time
+        *       any
+        5       value
+        1-5     range
+        */15    step, also 1-30/5
+        1,3,5   list
+    weekday: 0 or 7 is Sunday.
+    if both day and weekday are restricted, the time matches either of them, like cron.
+    """
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression must have 5 fields: {expression}")
+
+        self.expression = expression
+        values = [self._parse_(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes = sorted(values[0])
+        self.hours = sorted(values[1])
+        self.days = values[2]
+        self.months = values[3]
+        self.weekdays = set(v % 7 for v in values[4])
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_(part, low, high):
+        values = set()
+        for item in part.split(","):
+            step = 1
+            if "/" in item:
+                item, step = item.split("/")
+                step = int(step)
+
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = (int(v) for v in item.split("-"))
+            else:
+                start = end = int(item)
+
+            if start < low or end > high or start > end or step <= 0:
+                raise ValueError(f"invalid cron field: {part}")
+
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def _match_day_(self, day):
+        if day.month not in self.months:
+            return False
+
+        # isoweekday: Monday is 1, Sunday is 7
+        in_day = day.day in self.days
+        in_weekday = day.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_day and in_weekday
+        return in_day or in_weekday
+
+    def next(self, now: float) -> float:
+        """
+        :return: the first matched timestamp after now
+        """
+        start = datetime.fromtimestamp(now).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        # 8 years cover the leap day
+        for _ in range(366 * 8):
+            if self._match_day_(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+
+        raise ValueError(f"cron expression never matches: {self.expression}")
+
+
+class TimerWheel:
+    """
+    hierarchical timing wheel
+
+    time is cut into ticks of resolution seconds, there are levels wheels of slots,
+    a timer is put in the lowest wheel which can hold it, and moved to the lower wheel
+    when the upper wheel turns. so add, cancel and advance a tick are O(1)
+    no matter how many timers there are.
+
+    advance run every tick between the last advance and now, so a timer is never missed
+    even the loop is busy (it runs late), and it's removed from the wheel before run, so never run twice.
+    """
+
+    def __init__(self,
+                 resolution: float = 0.01,
+                 bits: int = 8,
+                 levels: int = 4,
+                 now: float = None,
+                 logger: logging.Logger = None):
+        self.resolution = resolution
+        self.bits = bits
+        self.levels = levels
+        self._mask_ = (1 << bits) - 1
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        # called with the awaitable returned by the callback, e.g. asyncio.ensure_future
+        self.on_awaitable = None
+
+        if now is None:
+            now = time.time()
+        # the next tick to run
+        self._tick_ = self._to_tick_(now)
+        self._wheels_ = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        # the timers too far to put in wheels
+        self._overflow_ = []
+        self._count_ = 0
+        # the timer of the earliest deadline, it's scanned again after timers are fired
+        self._earliest_ = None
+        self._earliest_dirty_ = False
+
+    def __len__(self):
+        return self._count_
+
+    def _to_tick_(self, timestamp):
+        return math.ceil(timestamp / self.resolution - 1e-9)
+
+    ###################### add ######################
+    def at(self, deadline, callback) -> Timer:
+        """
+        run callback once at deadline (timestamp or datetime)
+        """
+        if isinstance(deadline, datetime):
+            deadline = deadline.timestamp()
+        return self._add_(Timer(deadline, callback))
+
+    def after(self, seconds: float, callback) -> Timer:
+        """
+        run callback once after seconds
+        """
+        return self._add_(Timer(time.time() + seconds, callback))
+
+    def every(self, seconds: float, callback, first: float = None) -> Timer:
+        """
+        run callback every seconds
+        :param first: seconds to the first run, default seconds
+        """
+        if seconds <= 0:
+            raise ValueError("seconds must be more than 0")
+        first = seconds if first is None else first
+        return self._add_(Timer(time.time() + first, callback, interval=seconds))
+
+    def every_bar(self, period: float, callback, offset: float = 0.0) -> Timer:
+        """
+        run callback at the open of every bar, e.g. period=60*15 for M15
+        :param offset: seconds added to the bar boundary, e.g. the time zone of trade server for D1
+        """
+        if period <= 0:
+            raise ValueError("period must be more than 0")
+        return self._add_(Timer(_next_bar_(time.time(), period, offset), callback, period=period, offset=offset))
+
+    def cron(self, expression: str, callback) -> Timer:
+        """
+        run callback when the local time matches the cron expression, see Cron
+        """
+        cron = Cron(expression)
+        return self._add_(Timer(cron.next(time.time()), callback, cron=cron))
+
+    def _add_(self, timer):
+        self._count_ += 1
+        self._place_(timer)
+        if not self._earliest_dirty_ and (self._earliest_ is None or timer.deadline < self._earliest_.deadline):
+            self._earliest_ = timer
+        return timer
+
+    def _place_(self, timer):
+        tick = max(self._to_tick_(timer.deadline), self._tick_)
+        timer.tick = tick
+
+        current = self._tick_
+        for level in range(self.levels):
+            # the lowest level where tick and current share all upper digits
+            shift = self.bits * (level + 1)
+            if tick >> shift == current >> shift:
+                index = (tick >> (self.bits * level)) & self._mask_
+                self._wheels_[level][index].append(timer)
+                return
+
+        self._overflow_.append(timer)
+
+    ###################### run ######################
+    def next_deadline(self):
+        """
+        the earliest deadline of the timers in wheel, None if there is no timer,
+        the loop can sleep until it instead of polling the wheel
+        """
+        if self._count_ <= 0:
+            return None
+
+        earliest = self._earliest_
+        if self._earliest_dirty_ or earliest is None or earliest.cancelled:
+            earliest = self._scan_earliest_()
+            self._earliest_ = earliest
+            self._earliest_dirty_ = False
+
+        return None if earliest is None else earliest.deadline
+
+    def _scan_earliest_(self):
+        current = self._tick_
+        for level in range(self.levels):
+            # the slots of this level after current, the lower slots have been cascaded
+            shift = self.bits * level
+            for index in range((current >> shift) & self._mask_, 1 << self.bits):
+                timers = [t for t in self._wheels_[level][index] if not t.cancelled]
+                if len(timers) > 0:
+                    return min(timers, key=lambda t: t.deadline)
+
+        timers = [t for t in self._overflow_ if not t.cancelled]
+        if len(timers) > 0:
+            return min(timers, key=lambda t: t.deadline)
+
+        return None
+
+    def advance(self, now: float = None):
+        """
+        run the timers which deadline <= now
+        """
+        if now is None:
+            now = time.time()
+
+        target = math.floor(now / self.resolution + 1e-9)
+        while self._tick_ <= target:
+            # no timer, jump to now
+            if self._count_ <= 0:
+                self._tick_ = target + 1
+                return
+
+            tick = self._tick_
+            self._cascade_(tick)
+
+            # the timers added by callbacks go to the next tick
+            self._tick_ = tick + 1
+            slot = self._wheels_[0][tick & self._mask_]
+            if len(slot) > 0:
+                self._wheels_[0][tick & self._mask_] = []
+                self._earliest_dirty_ = True
+                slot.sort(key=lambda t: t.deadline)
+                for timer in slot:
+                    self._fire_(timer, now)
+
+    def _cascade_(self, tick):
+        if tick & self._mask_ != 0:
+            return
+
+        # the highest level which turns at this tick
+        top = 1
+        while top < self.levels and (tick >> (self.bits * top)) & self._mask_ == 0:
+            top += 1
+
+        if top == self.levels:
+            overflow, self._overflow_ = self._overflow_, []
+            for timer in overflow:
+                self._place_(timer)
+            top -= 1
+
+        for level in range(top, 0, -1):
+            index = (tick >> (self.bits * level)) & self._mask_
+            slot = self._wheels_[level][index]
+            if len(slot) > 0:
+                self._wheels_[level][index] = []
+                for timer in slot:
+                    self._place_(timer)
+
+    def _fire_(self, timer, now):
+        if timer.cancelled:
+            self._count_ -= 1
+            return
+
+        try:
+            result = timer.callback()
+            if inspect.isawaitable(result):
+                if self.on_awaitable is None:
+                    self.logger.warning(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                                        f"timer callback {timer.callback} return awaitable, but no event loop")
+                    if inspect.iscoroutine(result):
+                        result.close()
+                else:
+                    self.on_awaitable(result)
+        except Exception as e:
+            self.logger.exception(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} timer callback failed: {e}")
+
+        # reschedule periodic timer, it may be cancelled in callback
+        deadline = None if timer.cancelled else timer.next_deadline(max(now, timer.deadline))
+        if deadline is None:
+            self._count_ -= 1
+            return
+
+        timer.deadline = deadline
+        self._place_(timer)
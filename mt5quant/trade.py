@@ -1,18 +1,35 @@
+import math
+import time
 import logging
 from datetime import datetime
+from typing import TYPE_CHECKING
 
 import MetaTrader5 as mt5
-import pandas as pd
 
 from mt5quant.error import DataMissingError
 from mt5quant.position import get_pos
+from mt5quant.risk import RiskEngine, RISK_REJECT
+from mt5quant.monitor import PositionMonitor
+
+if TYPE_CHECKING:
+    # only for the type hint, the journal is created by the caller
+    from mt5quant.journal import TradeJournal
 
 
 class Trade:
     def __init__(self,
                  magic: int = 0,
                  slippage: int = 88,
-                 logger: logging.Logger=None):
+                 logger: logging.Logger=None,
+                 risk: RiskEngine=None,
+                 journal: "TradeJournal"=None,
+                 monitor: PositionMonitor=None):
+        """
+        risk: if set, every order which increase the position is checked and reserved by risk before sent,
+              the rejected order return RISK_REJECT
+        journal: if set, every request and result of order_send is recorded in journal
+        monitor: if set, the positions of symbol are reloaded by monitor after the order is filled
+        """
         self._MAGIC_ = magic
         self._SLIPPAGE_ = slippage
         if logger is None:
@@ -20,6 +37,22 @@ class Trade:
         else:
             self.logger = logger
 
+        self.risk = risk
+        self.journal = journal
+        self.monitor = monitor
+
+    def _send_(self, request):
+        """
+        mt5.order_send, and record the request and result in journal
+        """
+        if self.journal is None:
+            return mt5.order_send(request)
+
+        start = time.time()
+        result = mt5.order_send(request)
+        self.journal.record(request, result, start, time.time() - start)
+        return result
+
     def buy_open(self,
                  symbol: str,
                  lots: float,
@@ -28,6 +61,8 @@ class Trade:
                  comment: str = "buy open",
                  use_point: bool = True):
 
+        import pandas as pd
+
         symbol_info = mt5.symbol_info(symbol)
         if symbol_info is None:
             raise DataMissingError(f"can not find {symbol} info")
@@ -86,6 +121,10 @@ class Trade:
             if len(pos) > 0:
                 return 0
 
+        # pre-trade risk check
+        if self.risk is not None and not self.risk.check(symbol, lots, symbol_info.ask, reserve=True):
+            return RISK_REJECT
+
         # order send
         request = {
             "action": mt5.TRADE_ACTION_DEAL,
@@ -101,7 +140,12 @@ class Trade:
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": mt5.ORDER_FILLING_IOC,
         }
-        result = mt5.order_send(request)
+        # the reserved risk is released even if order_send raise
+        result = None
+        try:
+            result = self._send_(request)
+        finally:
+            self._on_result_(symbol, lots, result)
         self.logger.info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {result}")
 
         return result
@@ -116,6 +160,7 @@ class Trade:
         """
         see self.buy_close
         """
+        import pandas as pd
 
         symbol_info = mt5.symbol_info(symbol)
         if symbol_info is None:
@@ -175,6 +220,10 @@ class Trade:
             if len(pos) > 0:
                 return 0
 
+            # pre-trade risk check
+            if self.risk is not None and not self.risk.check(symbol, -lots, symbol_info.bid, reserve=True):
+                return RISK_REJECT
+
             # order send
             request = {
                 "action": mt5.TRADE_ACTION_DEAL,
@@ -190,7 +239,12 @@ class Trade:
                 "type_time": mt5.ORDER_TIME_GTC,
                 "type_filling": mt5.ORDER_FILLING_IOC,
             }
-            result = mt5.order_send(request)
+            # the reserved risk is released even if order_send raise
+            result = None
+            try:
+                result = self._send_(request)
+            finally:
+                self._on_result_(symbol, -lots, result)
             self.logger.info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {result}")
 
             return result
@@ -209,6 +263,7 @@ class Trade:
         magic: True: you will close the orders that include self._MAGIC_
                 False: close all kinds of magic's orders
         """
+        import pandas as pd
 
         pos = mt5.positions_get()
         if not (pos is None or len(pos) <= 0):
@@ -250,8 +305,12 @@ class Trade:
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": mt5.ORDER_FILLING_IOC,
         }
-        result = mt5.order_send(request)
+        result = self._send_(request)
         self.logger.info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {result}")
+        if self.risk is not None:
+            self.risk.invalidate()
+        if result.retcode == mt5.TRADE_RETCODE_DONE:
+            self._refresh_monitor_(item_pos.symbol)
         return result.retcode
 
     def sell_close(self,
@@ -259,6 +318,8 @@ class Trade:
                   symbol: str = None,
                   fuzzy: str = False):
 
+        import pandas as pd
+
         pos = mt5.positions_get()
         if not (pos is None or len(pos) <= 0):
             pos = pd.DataFrame(list(pos), columns=pos[0]._asdict().keys())
@@ -299,8 +360,12 @@ class Trade:
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": mt5.ORDER_FILLING_IOC,
         }
-        result = mt5.order_send(request)
+        result = self._send_(request)
         self.logger.info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {result}")
+        if self.risk is not None:
+            self.risk.invalidate()
+        if result.retcode == mt5.TRADE_RETCODE_DONE:
+            self._refresh_monitor_(item_pos.symbol)
         return result.retcode
 
     def s_sub(self, symbol, volume, ticket=0):
@@ -320,7 +385,7 @@ class Trade:
         if ticket != 0:
             request["position"] = ticket
 
-        result = mt5.order_send(request)
+        result = self._send_(request)
         if result is None:
             return 3
 
@@ -391,7 +456,7 @@ class Trade:
         if ticket != 0:
             request["position"] = ticket
 
-        result = mt5.order_send(request)
+        result = self._send_(request)
         print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} [{result.retcode}] {symbol} -> {volume}")
         return result.retcode
 
@@ -441,7 +506,13 @@ class Trade:
         # 开新的单子
         return self.b_sub(symbol, volume)
 
-    def trade(self, symbol, volume):
+    def trade(self, symbol, volume, reserved=False):
+        """
+        reserved: if True, skip the risk check, it's used when the order has been checked
+                  and reserved by plan_pos_batch
+        """
+        import pandas as pd
+
         if volume == 0:
             b = self.buy_close(symbol=symbol)
             s = self.sell_close(symbol=symbol)
@@ -453,26 +524,148 @@ class Trade:
             else:
                 return success
 
-        if volume < 0:
-            return self.s(symbol, volume*-1)
-        else:
-            return self.b(symbol, volume)
+        # pre-trade risk check, at the price the order will be sent
+        if self.risk is not None and not reserved:
+            tick = mt5.symbol_info_tick(symbol)
+            price = None if tick is None else (tick.ask if volume > 0 else tick.bid)
+            if not self.risk.check(symbol, volume, price, reserve=True):
+                return RISK_REJECT
 
-    def set_pos(self, symbol, volume):
-        _, pos = get_pos()
+        retcode = None
         try:
-            lots = pos.loc[symbol].values[0]
-            if 0.9999 * lots <= volume <= 1.0001 * lots:
-                return 10009
+            if volume < 0:
+                retcode = self.s(symbol, volume*-1)
+            else:
+                retcode = self.b(symbol, volume)
+        finally:
+            if self.risk is not None:
+                self.risk.release(symbol, volume, retcode == mt5.TRADE_RETCODE_DONE)
+            # some positions may be closed even if it's not done
+            self._refresh_monitor_(symbol)
+
+        return retcode
+
+    def set_pos(self, symbol, volume, reserved=None):
+        """
+        reserved: the volume to trade planned and reserved by plan_pos_batch,
+                  the position is read again here, so an order of the symbol filled after the plan
+                  (e.g. a concurrent set_pos) is never traded twice.
+                  if the position is changed, the reservation is given back and the new volume is checked again
+        """
+        _, pos = get_pos()
+        lots = pos.loc[symbol].values[0] if symbol in pos.index else 0
+        if _at_target_(lots, volume):
+            if reserved is not None:
+                self.release_orders({symbol: reserved})
+            return 10009
+
+        if reserved is not None:
+            # 0 closes all positions of symbol, it's right whatever the position is now
+            if reserved == 0 or math.isclose(volume - lots, reserved, rel_tol=1e-4):
+                return self.trade(symbol, reserved, reserved=True)
 
-            new_pos = volume - lots
-            res = self.trade(symbol, new_pos)
+            self.release_orders({symbol: reserved})
 
-        except:
-            res = self.trade(symbol, volume)
+        return self.trade(symbol, volume - lots)
+
+    def set_pos_batch(self, positions: dict):
+        """
+        set the net position of many symbols, e.g. a portfolio
+        the risk of all orders is checked at once by RiskEngine.check_batch
+        :param positions: symbol -> target net volume
+        :return: symbol -> result of self.trade, or RISK_REJECT
+        """
+        orders, res = self.plan_pos_batch(positions)
+        unsent = dict(orders)
+        try:
+            for symbol, volume in orders.items():
+                del unsent[symbol]
+                res[symbol] = self.set_pos(symbol, positions[symbol], volume)
+        finally:
+            self.release_orders(unsent)
 
         return res
 
+    def plan_pos_batch(self, positions: dict):
+        """
+        the orders to set the net position of many symbols, the risk is checked and reserved here,
+        the orders must be sent by self.set_pos(symbol, target, volume) or given back by release_orders
+        :param positions: symbol -> target net volume
+        :return: (symbol -> volume to trade, symbol -> result of the symbols needn't trade)
+        """
+        _, pos = get_pos()
+        orders = {}
+        res = {}
+        for symbol, volume in positions.items():
+            lots = pos.loc[symbol].values[0] if symbol in pos.index else 0
+            if _at_target_(lots, volume):
+                res[symbol] = 10009
+                continue
+
+            # close position doesn't need risk check
+            if volume == 0:
+                orders[symbol] = 0
+                continue
+
+            orders[symbol] = volume - lots
+
+        symbols = [symbol for symbol, volume in orders.items() if volume != 0]
+        if self.risk is not None and len(symbols) > 0:
+            prices = []
+            for symbol in symbols:
+                tick = mt5.symbol_info_tick(symbol)
+                prices.append(None if tick is None else (tick.ask if orders[symbol] > 0 else tick.bid))
+            allowed = self.risk.check_batch(symbols, [orders[symbol] for symbol in symbols], prices, reserve=True)
+            for symbol, ok in zip(symbols, allowed):
+                if not ok:
+                    del orders[symbol]
+                    res[symbol] = RISK_REJECT
+
+        return orders, res
+
+    def release_orders(self, orders: dict):
+        """
+        give back the risk reserved by plan_pos_batch for the orders which are not sent
+        :param orders: symbol -> volume
+        """
+        if self.risk is None:
+            return
+
+        for symbol, volume in orders.items():
+            self.risk.release(symbol, volume, False)
+
+    def _on_result_(self, symbol, volume, result):
+        """
+        release the position reserved by risk after order_send, and reload the positions of monitor
+        """
+        filled = result is not None and result.retcode == mt5.TRADE_RETCODE_DONE
+        if self.risk is not None:
+            if filled:
+                self.risk.release(symbol, volume, True, result.price)
+            else:
+                self.risk.release(symbol, volume, False)
+
+        if filled:
+            self._refresh_monitor_(symbol)
+
+    def _refresh_monitor_(self, symbol):
+        """
+        the positions filled by the strategy are seen by monitor at once, not after its refresh_interval
+        """
+        if self.monitor is None:
+            return
+
+        try:
+            self.monitor.refresh(symbol)
+        except Exception as e:
+            self.logger.exception(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                                  f"monitor refresh {symbol} failed: {e}")
+
+
+def _at_target_(lots, volume):
+    # the net position is negative for sell
+    return abs(volume - lots) <= 0.0001 * abs(lots)
+
 
 if __name__ == '__main__':
     symbol = "USDJPY#"
@@ -0,0 +1,127 @@
+"""
+a fake MetaTrader5 module for the tests
+
+the real MetaTrader5 is Windows only and needs a running terminal, so it's always replaced
+by this module before mt5quant is imported. the state of the fake terminal is reset for every test.
+"""
+import sys
+import types
+from collections import namedtuple
+from datetime import timezone
+
+import pytest
+
+AccountInfo = namedtuple("AccountInfo", "login balance equity margin margin_free currency")
+SymbolInfo = namedtuple("SymbolInfo", "name trade_contract_size bid ask volume_min volume_max point "
+                                      "trade_tick_value trade_tick_size")
+Tick = namedtuple("Tick", "time bid ask last time_msc")
+TradePosition = namedtuple("TradePosition", "ticket time symbol type magic volume price_open price_current "
+                                            "profit swap comment")
+OrderSendResult = namedtuple("OrderSendResult", "retcode deal order volume price bid ask comment request_id")
+
+CONSTANTS = {
+    "ORDER_TYPE_BUY": 0, "ORDER_TYPE_SELL": 1,
+    "POSITION_TYPE_BUY": 0, "POSITION_TYPE_SELL": 1,
+    "DEAL_TYPE_BUY": 0, "DEAL_TYPE_SELL": 1, "DEAL_TYPE_BALANCE": 2,
+    "DEAL_ENTRY_IN": 0, "DEAL_ENTRY_OUT": 1,
+    "TRADE_ACTION_DEAL": 1, "ORDER_TIME_GTC": 0, "ORDER_FILLING_IOC": 1,
+    "TRADE_RETCODE_DONE": 10009,
+}
+
+
+def _timestamp_(value):
+    # naive datetime is the trade server time, like MetaTrader5
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class FakeTerminal:
+    """
+    the state behind the fake MetaTrader5 module
+    the price of a symbol is 100 by default, bid == ask, contract size is 100,
+    so 1 lot is 10000 notional, and the margin of 1 lot is its price
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.account = AccountInfo(1, 100000.0, 100000.0, 0.0, 100000.0, "USD")
+        self.prices = {}
+        self.positions = []
+        self.deals = []
+        self.orders = []
+        # history_*_get calls: (table, date_from timestamp, date_to timestamp)
+        self.history_calls = []
+        self.margin_calls = 0
+        self.time_msc = 0
+        # send(request) -> result, replace it to fail or delay order_send
+        self.send = self.fill
+        self.sent = []
+
+    def price(self, symbol):
+        return self.prices.get(symbol, 100.0)
+
+    def fill(self, request):
+        return OrderSendResult(CONSTANTS["TRADE_RETCODE_DONE"], len(self.sent), len(self.sent),
+                               request["volume"], request["price"], request["price"], request["price"],
+                               "done", 0)
+
+    def module(self):
+        module = types.ModuleType("MetaTrader5")
+        module.__dict__.update(CONSTANTS)
+
+        def symbol_info(symbol):
+            price = self.price(symbol)
+            return SymbolInfo(symbol, 100.0, price, price, 0.01, 100.0, 0.01, 1.0, 0.01)
+
+        def symbol_info_tick(symbol):
+            self.time_msc += 1
+            price = self.price(symbol)
+            return Tick(self.time_msc // 1000, price, price, 0.0, self.time_msc)
+
+        def positions_get(symbol=None, **kwargs):
+            return tuple(p for p in self.positions if symbol is None or p.symbol == symbol)
+
+        def order_calc_margin(order_type, symbol, volume, price):
+            self.margin_calls += 1
+            return price * volume
+
+        def order_send(request):
+            self.sent.append(request)
+            return self.send(request)
+
+        def history_get(table):
+            def fetch(date_from, date_to):
+                start, end = _timestamp_(date_from), _timestamp_(date_to)
+                self.history_calls.append((table, start, end))
+                records = self.deals if table == "deals" else self.orders
+                time_column = "time" if table == "deals" else "time_done"
+                return tuple(r for r in records if start <= getattr(r, time_column) <= end)
+            return fetch
+
+        module.account_info = lambda: self.account
+        module.symbol_info = symbol_info
+        module.symbol_info_tick = symbol_info_tick
+        module.positions_get = positions_get
+        module.orders_get = lambda **kwargs: ()
+        module.order_calc_margin = order_calc_margin
+        module.order_send = order_send
+        module.history_deals_get = history_get("deals")
+        module.history_orders_get = history_get("orders")
+        module.last_error = lambda: (1, "Success")
+        module.initialize = lambda *args, **kwargs: True
+        module.login = lambda *args, **kwargs: True
+        module.shutdown = lambda: None
+        return module
+
+
+TERMINAL = FakeTerminal()
+sys.modules["MetaTrader5"] = TERMINAL.module()
+
+
+@pytest.fixture
+def terminal():
+    TERMINAL.reset()
+    return TERMINAL
@@ -0,0 +1,83 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from conftest import TERMINAL, TradePosition
+from mt5quant.quant import STRATEGY_STATUES
+from mt5quant.async_quant import AsyncMT5Quant
+
+
+class TimerStrategy(AsyncMT5Quant):
+
+    def OnInit(self):
+        self.events = []
+        self.timers.after(0, self.on_timer)
+
+    async def on_timer(self):
+        self.events.append("timer start")
+        await asyncio.sleep(0.05)
+        self.events.append("timer done")
+
+    async def OnTick(self, symbol):
+        if "timer start" in self.events:
+            self._STRATEGY_STATUE_ = STRATEGY_STATUES.CLOSE
+
+    def OnDeinit(self, reason):
+        self.events.append("deinit")
+
+
+def test_timer_task_is_waited_before_deinit(terminal):
+    strategy = TimerStrategy("A")
+    strategy.run()
+
+    assert strategy.events == ["timer start", "timer done", "deinit"]
+    assert len(strategy._tasks_) == 0
+
+
+class SlowOrderStrategy(AsyncMT5Quant):
+
+    def OnInit(self):
+        self.polls = None
+
+    async def OnTick(self, symbol):
+        before = TERMINAL.time_msc
+        await self.trade.buy_open("A", 0.01, 0, 0)
+        self.polls = TERMINAL.time_msc - before
+        self._STRATEGY_STATUE_ = STRATEGY_STATUES.CLOSE
+
+
+def test_poll_never_wait_for_orders(terminal):
+    def slow(request):
+        time.sleep(0.2)
+        return terminal.fill(request)
+    terminal.send = slow
+
+    # one order thread is busy with the order, the ticks are still polled every poll_interval
+    strategy = SlowOrderStrategy("A", max_workers=1, poll_interval=0.01)
+    strategy.run()
+    assert strategy.polls > 5
+
+
+class ThresholdStrategy(AsyncMT5Quant):
+
+    def OnInit(self):
+        self.calls = []
+        self.monitor.add_threshold("loss", 500, self.on_loss)
+
+    def on_loss(self, monitor, kind, value):
+        self.calls.append((kind, value, threading.current_thread() is threading.main_thread()))
+        self._STRATEGY_STATUE_ = STRATEGY_STATUES.CLOSE
+
+    async def OnTick(self, symbol): ...
+
+
+def test_threshold_callback_in_event_loop(terminal):
+    terminal.positions = [TradePosition(1, 0, "A", 0, 0, 1.0, 100.0, 100.0, 0.0, 0.0, "")]
+    terminal.prices["A"] = 90
+
+    strategy = ThresholdStrategy("A", monitor=True)
+    strategy.run()
+    assert strategy.calls == [("loss", pytest.approx(1000), True)]
+    assert strategy.monitor.dispatch is None
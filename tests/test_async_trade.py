@@ -0,0 +1,133 @@
+import time
+import asyncio
+
+from conftest import TradePosition
+from mt5quant.risk import RiskEngine
+from mt5quant.trade import Trade
+from mt5quant.async_trade import AsyncTrade
+
+
+def _filled_positions(terminal, delay=0.0):
+    """
+    order_send of the fake terminal which opens a position after delay seconds
+    """
+    def send(request):
+        time.sleep(delay)
+        terminal.positions.append(TradePosition(len(terminal.sent), 0, request["symbol"], request["type"], 1,
+                                                request["volume"], 100.0, 100.0, 0.0, 0.0, ""))
+        return terminal.fill(request)
+    return send
+
+
+def _net(terminal, symbol):
+    return sum(p.volume * (1 if p.type == 0 else -1) for p in terminal.positions if p.symbol == symbol)
+
+
+###################### set_pos ######################
+def test_set_pos_batch_read_position_in_lock(terminal):
+    terminal.send = _filled_positions(terminal, delay=0.05)
+    risk = RiskEngine(max_lots=10)
+    trade = AsyncTrade(Trade(magic=1, risk=risk), max_workers=4)
+
+    async def main():
+        # the batch is planned while the first set_pos is sending
+        first = asyncio.create_task(trade.set_pos("A", 1))
+        await asyncio.sleep(0.01)
+        batch = asyncio.create_task(trade.set_pos_batch({"A": 1}))
+        return await first, await batch
+
+    first, batch = asyncio.run(main())
+    trade.close()
+
+    assert first == 10009
+    assert batch == {"A": 10009}
+    assert len(terminal.sent) == 1
+    assert _net(terminal, "A") == 1
+    assert risk._reserved_ == {}
+
+
+def test_set_pos_changed_after_plan(terminal):
+    terminal.send = _filled_positions(terminal)
+    risk = RiskEngine(max_lots=10)
+    trade = Trade(magic=1, risk=risk)
+
+    orders, res = trade.plan_pos_batch({"A": 1, "B": -1})
+    assert orders == {"A": 1, "B": -1} and res == {}
+
+    # half of A is filled by other order after the plan
+    trade.trade("A", 0.5)
+    assert trade.set_pos("A", 1, orders["A"]) == 10009
+    assert trade.set_pos("B", -1, orders["B"]) == 10009
+    assert [r["volume"] for r in terminal.sent] == [0.5, 0.5, 1]
+    assert (_net(terminal, "A"), _net(terminal, "B")) == (1, -1)
+    assert risk._reserved_ == {}
+
+    # a short position at target is kept
+    assert trade.set_pos("B", -1) == 10009
+    assert len(terminal.sent) == 3
+
+
+###################### gather ######################
+def test_gather_timeout_keep_sent_orders(terminal):
+    terminal.send = _filled_positions(terminal, delay=0.2)
+    trade = AsyncTrade(Trade(magic=1), max_workers=1)
+
+    async def main():
+        return await trade.gather(trade.buy_open("A", 1, 0, 0), trade.buy_open("B", 1, 0, 0), timeout=0.05)
+
+    sent, unsent = asyncio.run(main())
+    trade.close()
+
+    # A is running in terminal at timeout, it's waited and its result is kept
+    assert sent.retcode == 10009
+    # B waits for the worker and it's never sent
+    assert isinstance(unsent, asyncio.TimeoutError)
+    assert [r["symbol"] for r in terminal.sent] == ["A"]
+
+
+def test_cancel_after_sent_return_result(terminal):
+    terminal.send = _filled_positions(terminal, delay=0.1)
+    trade = AsyncTrade(Trade(magic=1), max_workers=1)
+
+    async def main():
+        task = asyncio.create_task(trade.buy_open("A", 1, 0, 0))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        return await task
+
+    assert asyncio.run(main()).retcode == 10009
+    trade.close()
+
+
+def test_gather_keep_exception_and_cancelled(terminal):
+    trade = AsyncTrade(Trade(magic=1))
+
+    async def fail():
+        raise ValueError("bad order")
+
+    async def main():
+        cancelled = asyncio.ensure_future(asyncio.sleep(1))
+        cancelled.cancel()
+        return await trade.gather(trade.buy_open("A", 1, 0, 0), fail(), cancelled)
+
+    filled, failed, cancelled = asyncio.run(main())
+    trade.close()
+
+    assert filled.retcode == 10009
+    assert isinstance(failed, ValueError)
+    # cancelled by other, not by timeout
+    assert isinstance(cancelled, asyncio.CancelledError)
+
+
+def test_set_pos_batch_timeout_release_unsent(terminal):
+    terminal.send = _filled_positions(terminal, delay=0.2)
+    risk = RiskEngine(max_lots=10)
+    trade = AsyncTrade(Trade(magic=1, risk=risk), max_workers=1)
+
+    res = asyncio.run(trade.set_pos_batch({"A": 1, "B": 1}, timeout=0.05))
+    trade.close()
+
+    assert res["A"] == 10009
+    assert isinstance(res["B"], asyncio.TimeoutError)
+    assert risk._reserved_ == {}
+    assert risk.lots("B") == 0
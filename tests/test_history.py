@@ -0,0 +1,88 @@
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+
+from mt5quant.history import HistorySync, DEAL_COLUMNS, ORDER_COLUMNS
+
+TradeDeal = namedtuple("TradeDeal", [name for name, _ in DEAL_COLUMNS])
+TradeOrder = namedtuple("TradeOrder", [name for name, _ in ORDER_COLUMNS])
+
+START = datetime(2026, 1, 1)
+T0 = 1767225600  # 2026-01-01 00:00:00 server time
+
+
+def _deal(ticket, time, profit=1.0, magic=1, symbol="A"):
+    values = dict.fromkeys(TradeDeal._fields, 0)
+    values.update(ticket=ticket, time=time, time_msc=time * 1000, magic=magic, volume=1.0, price=100.0,
+                  profit=profit, symbol=symbol, comment="", external_id="")
+    return TradeDeal(**values)
+
+
+def _order(ticket, time_done):
+    values = dict.fromkeys(TradeOrder._fields, 0)
+    values.update(ticket=ticket, time_setup=time_done, time_done=time_done, symbol="A", comment="", external_id="")
+    return TradeOrder(**values)
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = HistorySync(str(tmp_path / "history.db"), start=START, overlap=60)
+    yield history
+    history.close()
+
+
+def test_first_sync_from_start(terminal, history):
+    assert history.cursor("deals") is None
+    terminal.deals = [_deal(1, T0 + 10), _deal(2, T0 + 20)]
+    terminal.orders = [_order(1, T0 + 10)]
+
+    assert history.sync() == {"deals": 2, "orders": 1}
+    assert [(table, start) for table, start, _ in terminal.history_calls] == [("deals", T0), ("orders", T0)]
+    assert history.cursor("deals") == T0 + 20
+    assert history.cursor("orders") == T0 + 10
+
+
+def test_sync_from_cursor_with_overlap(terminal, history):
+    terminal.deals = [_deal(1, T0 + 1000)]
+    history.sync()
+
+    # a deal in the same second as the cursor, it's only caught by the overlap
+    terminal.deals += [_deal(2, T0 + 1000), _deal(3, T0 + 2000)]
+    terminal.history_calls.clear()
+    assert history.sync()["deals"] == 3
+
+    table, start, _ = terminal.history_calls[0]
+    assert (table, start) == ("deals", T0 + 1000 - 60)
+    assert history.cursor("deals") == T0 + 2000
+    assert history.deals()["ticket"].tolist() == [1, 2, 3]
+    # the orders table is still empty, it's fetched from start
+    assert terminal.history_calls[1][:2] == ("orders", T0)
+
+
+def test_overlap_never_duplicate(terminal, history):
+    terminal.deals = [_deal(1, T0 + 10, profit=1.0), _deal(2, T0 + 20, profit=2.0)]
+    history.sync()
+
+    # the records fetched again replace the stored ones, e.g. the profit is corrected
+    terminal.deals[1] = _deal(2, T0 + 20, profit=5.0)
+    history.sync()
+    history.sync()
+
+    deals = history.deals()
+    assert deals["ticket"].tolist() == [1, 2]
+    assert deals["profit"].tolist() == [1.0, 5.0]
+
+
+def test_query_and_pnl(terminal, history):
+    terminal.deals = [_deal(1, T0 + 10, 1.0, magic=1), _deal(2, T0 + 86400, 2.0, magic=2, symbol="B"),
+                      _deal(3, T0 + 86400 + 5, 4.0, magic=1)]
+    history.sync()
+
+    assert history.deals(start=T0 + 86400)["ticket"].tolist() == [2, 3]
+    assert history.deals(symbol="B")["ticket"].tolist() == [2]
+
+    table = history.pnl_per_magic_day()
+    assert table.shape == (2, 2)
+    assert table[1].tolist() == [1.0, 4.0]
+    assert table[2].tolist() == [0.0, 2.0]
@@ -0,0 +1,121 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from mt5quant.journal import TradeJournal, NO_RESULT
+
+Result = namedtuple("Result", "retcode deal order volume price bid ask")
+
+
+def _request(symbol, volume=1.0, magic=1, comment=""):
+    return {"action": 1, "type": 0, "symbol": symbol, "volume": volume, "price": 100.0,
+            "magic": magic, "comment": comment}
+
+
+def _record(journal, n, start=0.0, symbols=("A", "B")):
+    for i in range(n):
+        symbol = symbols[i % len(symbols)]
+        journal.record(_request(symbol, volume=i, magic=1 + i % 2), Result(10009, i, i, i, 100.0, 99.0, 101.0),
+                       start=start + i)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = TradeJournal(str(tmp_path), compact_segments=None)
+    yield journal
+    journal.close()
+
+
+def test_round_trip(journal):
+    _record(journal, 10)
+    journal.record(_request("C"), None, start=10.0)
+    journal.flush()
+
+    res = journal.query()
+    assert res["time"].tolist() == list(range(11))
+    assert res["symbol"].tolist() == ["A", "B"] * 5 + ["C"]
+    assert res["volume_request"][:10].tolist() == list(range(10))
+    assert res["retcode"][-1] == NO_RESULT
+
+    # the other journal on the same path sees the same records
+    other = TradeJournal(journal.path, compact_segments=None)
+    other.close()
+    assert other.query(columns=["time"])["time"].tolist() == list(range(11))
+
+
+def test_query_filter(journal):
+    _record(journal, 10)
+    journal.flush()
+    _record(journal, 10, start=10)
+    journal.flush()
+
+    res = journal.query(start=5, end=15, symbol="A", magic=1, columns=["time", "symbol"])
+    assert res["time"].tolist() == [6, 8, 10, 12, 14]
+    assert set(res["symbol"]) == {"A"}
+    assert len(journal.query(symbol="C")["time"]) == 0
+
+
+def test_compact(journal):
+    for i in range(5):
+        _record(journal, 4, start=i * 4, symbols=(f"S{i}",))
+        journal.flush()
+    before = journal.query()
+    assert len(journal.segments()) == 5
+
+    segment = journal.compact(min_rows=100)
+    assert [s for s, _ in journal.segments()] == [segment]
+    assert sorted(os.listdir(journal.path)) == sorted([segment, "manifest.json"])
+
+    after = journal.query()
+    assert after["time"].tolist() == list(range(20))
+    for name in before:
+        assert np.array_equal(before[name], after[name])
+
+
+def test_replaced_segments_are_hidden(journal):
+    _record(journal, 4)
+    journal.flush()
+    _record(journal, 4, start=4)
+    journal.flush()
+    old = [s for s, _ in journal.segments()]
+
+    # a compact which stopped after the merged segment is published
+    remove_replaced = journal._remove_replaced_
+    journal._remove_replaced_ = lambda: None
+    merged = journal.compact(min_rows=100)
+    assert all(os.path.isdir(os.path.join(journal.path, s)) for s in old)
+    assert [s for s, _ in journal.segments()] == [merged]
+    assert journal.query()["time"].tolist() == list(range(8))
+
+    # the next compact removes them
+    journal._remove_replaced_ = remove_replaced
+    assert journal.compact(min_rows=100) is None
+    assert not any(os.path.exists(os.path.join(journal.path, s)) for s in old)
+
+
+def test_auto_compact(tmp_path):
+    journal = TradeJournal(str(tmp_path), compact_segments=4, compact_rows=100)
+    for i in range(10):
+        _record(journal, 2, start=i * 2)
+        journal.flush()
+    journal.close()
+
+    assert len(journal.segments()) < 4
+    assert journal.query()["time"].tolist() == list(range(20))
+
+
+def test_query_use_manifest(journal, monkeypatch):
+    _record(journal, 4)
+    journal.flush()
+    _record(journal, 4, start=4)
+    journal.flush()
+
+    other = TradeJournal(journal.path, compact_segments=None)
+    other.close()
+
+    def read_meta(segment):
+        raise AssertionError(f"meta.json of {segment} is read")
+    monkeypatch.setattr(other, "_read_meta_", read_meta)
+    assert other.query()["time"].tolist() == list(range(8))
@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import TradePosition
+from mt5quant.monitor import PositionMonitor
+from mt5quant.trade import Trade
+
+
+def _position(symbol, volume, ticket=1, price_open=100.0):
+    return TradePosition(ticket, 0, symbol, 0 if volume > 0 else 1, 0, abs(volume), price_open, price_open,
+                         0.0, 0.0, "")
+
+
+def test_on_tick_revalue(terminal):
+    terminal.positions = [_position("A", 1), _position("B", -2, 2)]
+    monitor = PositionMonitor()
+    monitor.refresh()
+    assert monitor.symbols() == ["A", "B"]
+    assert monitor.pnl() == pytest.approx(0)
+
+    # 1 lot move 1.0 is 100 profit
+    terminal.prices["A"] = 101
+    monitor.on_tick("A")
+    assert monitor.pnl("A") == pytest.approx(100)
+    assert monitor.exposure() == pytest.approx(10100 + 20000)
+
+
+def test_on_tick_never_refresh(terminal):
+    monitor = PositionMonitor(refresh_interval=0)
+    monitor.refresh()
+    terminal.positions = [_position("A", 1)]
+    monitor.on_tick("A")
+    assert monitor.symbols() == []
+
+    # the loop reloads it
+    assert monitor.refresh_if_due()
+    assert monitor.symbols() == ["A"]
+
+
+def test_refresh_if_due(terminal):
+    monitor = PositionMonitor(refresh_interval=60)
+    assert monitor.refresh_if_due()
+    terminal.positions = [_position("A", 1)]
+    assert not monitor.refresh_if_due()
+    assert monitor.symbols() == []
+
+
+def test_trade_refresh_monitor_after_fill(terminal):
+    monitor = PositionMonitor(refresh_interval=60)
+    monitor.refresh()
+    trade = Trade(monitor=monitor)
+
+    def fill(request):
+        terminal.positions.append(_position(request["symbol"], request["volume"], len(terminal.sent)))
+        return terminal.fill(request)
+    terminal.send = fill
+
+    trade.buy_open("A", 1, 0, 0)
+    assert monitor.symbols() == ["A"]
+    assert monitor.positions("A")[0].tolist() == [1]
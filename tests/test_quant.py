@@ -0,0 +1,21 @@
+from mt5quant.quant import MT5Quant, STRATEGY_STATUES
+
+
+class CountStrategy(MT5Quant):
+
+    def OnInit(self):
+        self.ticks = 0
+
+    def OnTick(self):
+        self.ticks += 1
+        if self.ticks == 3:
+            self._STRATEGY_STATUE_ = STRATEGY_STATUES.CLOSE
+
+
+def test_one_tick_fetch_per_poll(terminal):
+    strategy = CountStrategy("A")
+    strategy.run()
+
+    # every tick of the fake terminal is new, OnTick is called by each poll
+    assert strategy.ticks == 3
+    assert terminal.time_msc == 3
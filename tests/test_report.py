@@ -0,0 +1,89 @@
+import os
+import sys
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mt5quant.report import PerformanceReport, drawdown, iter_drawdown, max_drawdown
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_without_metatrader5():
+    code = "import sys; sys.modules['MetaTrader5'] = None; import mt5quant.report"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+
+
+class _History:
+
+    def __init__(self, deals):
+        self._deals_ = deals
+
+    def deals(self, start=None, end=None):
+        return self._deals_
+
+
+def test_from_history():
+    # 2 is a balance deal, it's not a trade
+    deals = pd.DataFrame({
+        "time": [1, 2, 3, 4], "magic": [1, 1, 2, 0], "type": [0, 1, 0, 2], "volume": [1.0, 1.0, 2.0, 0.0],
+        "symbol": ["A", "A", "B", ""], "profit": [0.0, 10.0, -5.0, 1000.0],
+        "commission": [-1.0, -1.0, 0.0, 0.0], "swap": [0.0, 0.0, 0.0, 0.0], "fee": [np.nan] * 4,
+    })
+    report = PerformanceReport.from_history(_History(deals), balance=100)
+
+    assert sorted(report.stats) == [1, 2]
+    assert report.stats[1]["pnl"] == 8
+    assert report.stats[2]["end"] == 95
+    assert report._exposure_[1][1].tolist() == [1, 0]
+
+
+def _random_equity(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return 1000 + np.cumsum(rng.normal(0, 1, size))
+
+
+def test_chunked_drawdown_same_as_full():
+    equity = _random_equity(50000)
+    dd, ratio = drawdown(equity)
+
+    chunks = list(iter_drawdown(equity, chunk=999))
+    assert np.allclose(np.concatenate([c[1] for c in chunks]), dd)
+    assert np.allclose(np.concatenate([c[2] for c in chunks]), ratio)
+    assert max_drawdown(equity, chunk=999) == (pytest.approx(dd.min()), pytest.approx(ratio.min()))
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb", "minmaxlttb"])
+def test_add_equity_in_chunks(method):
+    equity = _random_equity(200000, seed=1)
+    time = np.arange(len(equity), dtype=float)
+    _, ratio = drawdown(equity)
+
+    full = PerformanceReport(points=500, method=method)
+    full.add_equity("a", time, equity)
+    chunked = PerformanceReport(points=500, method=method, chunk=10000)
+    chunked.add_equity("a", time, equity)
+
+    assert chunked.stats == full.stats
+    x, y = chunked._drawdown_["a"]
+    assert len(x) <= 500 + 2 * 20
+    # the trough of drawdown is kept
+    assert y.min() == ratio.min()
+    assert np.array_equal(y, ratio[x.astype(np.int64)])
+
+
+def test_add_equity_memory_bounded():
+    equity = _random_equity(2000000, seed=2)
+    time = np.arange(len(equity), dtype=float)
+    report = PerformanceReport(chunk=1 << 16)
+
+    tracemalloc.start()
+    report.add_equity("a", time, equity)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # a few arrays of one chunk, the full drawdown and its ratio are 32 MB
+    assert peak < 8 * 2 ** 20
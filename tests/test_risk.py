@@ -0,0 +1,150 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import TradePosition
+from mt5quant.risk import RiskEngine, RISK_REJECT
+from mt5quant.trade import Trade
+
+
+def _position(symbol, volume, ticket=1):
+    # volume is signed, less than 0 is sell
+    return TradePosition(ticket, 0, symbol, 0 if volume > 0 else 1, 0, abs(volume), 100.0, 100.0, 0.0, 0.0, "")
+
+
+###################### check ######################
+def test_check_limits(terminal):
+    risk = RiskEngine(max_lots=2, max_notional=15000)
+    assert risk.check("A", 1)
+    assert not risk.check("A", 3)
+    assert not risk.check("A", 1.6)
+
+    # the cached price follows update_price
+    risk.update_price("A", 200, 200)
+    assert not risk.check("A", 1)
+
+
+def test_reduce_is_always_allowed(terminal):
+    terminal.positions = [_position("A", 2)]
+    risk = RiskEngine(max_notional=1000)
+    assert risk.lots("A") == 0
+    assert risk.check("A", -1, reserve=True)
+    assert not risk.check("A", 1)
+
+    # the order which reduce the position is not reserved, it's applied when filled
+    assert risk.lots("A") == 2
+    risk.release("A", -1, True)
+    assert risk.lots("A") == 1
+
+
+def test_margin_is_cached(terminal):
+    risk = RiskEngine()
+    risk.margin("A", 1)
+    risk.margin("A", 2)
+    assert terminal.margin_calls == 1
+    assert risk.margin("A", 2) == pytest.approx(200)
+
+    # inside price tolerance it's scaled, outside it's calculated again
+    assert risk.margin("A", 1, 100.5) == pytest.approx(100.5)
+    assert terminal.margin_calls == 1
+    risk.margin("A", 1, 110)
+    assert terminal.margin_calls == 2
+
+
+###################### reserve ######################
+def test_reserve_release(terminal):
+    risk = RiskEngine(max_notional=15000)
+    assert risk.check("A", 1, reserve=True)
+    assert risk.lots("A") == 1
+    # the reserved order is counted, so the concurrent order is rejected
+    assert not risk.check("B", 1, reserve=True)
+
+    risk.release("A", 1, False)
+    assert risk.lots("A") == 0
+    assert risk.check("B", 1, reserve=True)
+
+    risk.release("B", 1, True)
+    assert risk.lots("B") == 1
+
+
+def test_refresh_keeps_reserved(terminal):
+    risk = RiskEngine(max_notional=25000)
+    assert risk.check("A", 1, reserve=True)
+    assert risk.check("B", 1, reserve=True)
+
+    # A is filled and in positions, B is still sending
+    risk.release("A", 1, True)
+    terminal.positions = [_position("A", 1)]
+    risk.refresh()
+    assert risk.lots("A") == 1
+    assert risk.lots("B") == 1
+    assert not risk.check("C", 1)
+
+    risk.release("B", 1, False)
+    risk.refresh()
+    assert risk.lots("B") == 0
+    assert risk.check("C", 1)
+
+
+def test_buy_open_release_when_send_raise(terminal):
+    risk = RiskEngine(max_notional=15000)
+    trade = Trade(risk=risk)
+
+    def broken(request):
+        raise RuntimeError("terminal is gone")
+    terminal.send = broken
+
+    with pytest.raises(RuntimeError):
+        trade.buy_open("A", 1, 0, 0)
+    assert risk.lots("A") == 0
+    assert risk._reserved_ == {}
+
+    terminal.send = terminal.fill
+    assert trade.buy_open("A", 1, 0, 0).retcode == 10009
+    assert risk._reserved_ == {}
+    assert trade.buy_open("B", 1, 0, 0) == RISK_REJECT
+
+
+###################### batch ######################
+def test_check_batch_greedy(terminal):
+    risk = RiskEngine(max_notional=25000)
+    ok = risk.check_batch(["A", "B", "C"], [2, 1, 0.5], reserve=True)
+    assert ok.tolist() == [True, False, True]
+    assert (risk.lots("A"), risk.lots("B"), risk.lots("C")) == (2, 0, 0.5)
+    assert not risk.check("D", 0.1)
+
+    for symbol, volume in (("A", 2), ("C", 0.5)):
+        risk.release(symbol, volume, False)
+    assert risk.check("D", 2.5)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_check_batch_same_as_check_one_by_one(terminal, seed):
+    rng = random.Random(seed)
+    symbols = [f"S{i}" for i in range(50)]
+    for symbol in symbols:
+        terminal.prices[symbol] = rng.uniform(50, 150)
+    terminal.positions = [_position(symbol, rng.choice([-1, 1]) * rng.uniform(0.1, 1), i)
+                          for i, symbol in enumerate(symbols[:20])]
+    volumes = [rng.choice([-1, 1]) * rng.uniform(0.1, 1.5) for _ in symbols]
+    limits = dict(max_lots=1.5, max_notional=200000, max_margin=1500, min_free_margin=98800)
+
+    batch = RiskEngine(**limits)
+    ok = batch.check_batch(symbols, volumes, reserve=True)
+
+    single = RiskEngine(**limits)
+    expected = [single.check(symbol, volume, reserve=True) for symbol, volume in zip(symbols, volumes)]
+
+    assert ok.tolist() == expected
+    assert 0 < sum(expected) < len(expected)
+    assert [batch.lots(s) for s in symbols] == pytest.approx([single.lots(s) for s in symbols])
+    assert batch._total_margin_ == pytest.approx(single._total_margin_)
+    assert batch._total_notional_ == pytest.approx(single._total_notional_)
+
+
+def test_check_batch_use_given_prices(terminal):
+    risk = RiskEngine(max_notional=25000)
+    ok = risk.check_batch(["A", "B"], [1, 1], [100, 200])
+    assert ok.tolist() == [True, False]
+    assert isinstance(ok, np.ndarray)
@@ -0,0 +1,161 @@
+import random
+import types
+from datetime import datetime
+
+import pytest
+
+from mt5quant import timer as timer_module
+from mt5quant.timer import Cron, TimerWheel
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    fake time.time of timer module, the wheel registers every/every_bar/cron from it
+    """
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(timer_module, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+###################### wheel ######################
+@pytest.mark.parametrize("seed", range(20))
+def test_random_advance_never_missed_never_twice(seed):
+    rng = random.Random(seed)
+    # 2 levels of 4 slots hold 16 ticks, the far timers go to overflow and cascade back
+    wheel = TimerWheel(resolution=1, bits=2, levels=2, now=0)
+
+    fired = {}
+    deadlines = {}
+    cancelled = set()
+
+    def add(key, deadline):
+        deadlines[key] = deadline
+        return wheel.at(deadline, lambda: on_fire(key))
+
+    def on_fire(key):
+        fired.setdefault(key, []).append((previous, now))
+        # the timers added by callbacks, some of them cascade from overflow
+        if rng.random() < 0.2 and now < 300:
+            add(f"{key}+", now + rng.choice([1, 3, 17, 70]))
+
+    timers = {}
+    for i in range(200):
+        timers[i] = add(i, rng.randrange(0, 300))
+    for i in rng.sample(range(200), 20):
+        timers[i].cancel()
+        cancelled.add(i)
+
+    now = 0
+    previous = -1
+    while now < 500:
+        pending = [d for k, d in deadlines.items() if k not in fired and k not in cancelled]
+        expected = min(pending) if len(pending) > 0 else None
+        assert wheel.next_deadline() == expected
+
+        wheel.advance(now)
+        for key, deadline in deadlines.items():
+            if key in cancelled:
+                assert key not in fired
+            elif deadline <= now:
+                # run exactly once, by the first advance which reaches the deadline
+                assert len(fired[key]) == 1
+                before, at = fired[key][0]
+                assert before < deadline <= at
+            else:
+                assert key not in fired
+
+        previous = now
+        now += rng.choice([0, 1, 1, 2, 5, 16, 40, 100])
+
+    assert len(wheel) == 0
+    assert wheel.next_deadline() is None
+
+
+def test_next_deadline_skip_cancelled():
+    wheel = TimerWheel(resolution=1, bits=2, levels=2, now=0)
+    first = wheel.at(5, lambda: None)
+    wheel.at(100, lambda: None)
+    assert wheel.next_deadline() == 5
+
+    first.cancel()
+    assert wheel.next_deadline() == 100
+
+
+def test_next_deadline_after_fire_and_add():
+    wheel = TimerWheel(resolution=1, now=0)
+    assert wheel.next_deadline() is None
+
+    wheel.at(10, lambda: None)
+    wheel.at(3, lambda: wheel.at(5, lambda: None))
+    assert wheel.next_deadline() == 3
+
+    wheel.advance(3)
+    assert wheel.next_deadline() == 5
+    wheel.at(4, lambda: None)
+    assert wheel.next_deadline() == 4
+
+    wheel.advance(5)
+    assert wheel.next_deadline() == 10
+
+
+###################### periodic ######################
+def test_late_every_runs_once(clock):
+    wheel = TimerWheel(resolution=1, now=clock.now)
+    runs = []
+    wheel.every(10, lambda: runs.append(clock.now))
+
+    # 4 runs are late, they are merged into one
+    clock.now = 1055
+    wheel.advance(clock.now)
+    assert runs == [1055]
+    # the next run keeps the grid of the first deadline
+    assert wheel.next_deadline() == 1060
+
+    clock.now = 1060
+    wheel.advance(clock.now)
+    assert runs == [1055, 1060]
+
+
+def test_late_every_bar_runs_once(clock):
+    wheel = TimerWheel(resolution=1, now=clock.now)
+    runs = []
+    wheel.every_bar(60, lambda: runs.append(clock.now))
+    assert wheel.next_deadline() == 1020
+
+    clock.now = 1200
+    wheel.advance(clock.now)
+    assert runs == [1200]
+    assert wheel.next_deadline() == 1260
+
+
+###################### cron ######################
+def _next_runs_(cron, start, n):
+    runs = []
+    now = start.timestamp()
+    for _ in range(n):
+        now = cron.next(now)
+        runs.append(datetime.fromtimestamp(now))
+    return runs
+
+
+def test_cron_day_or_weekday():
+    # 2026-01-01 is Thursday, day 13 or Friday
+    runs = _next_runs_(Cron("0 12 13 * 5"), datetime(2026, 1, 1), 4)
+    assert runs == [datetime(2026, 1, 2, 12), datetime(2026, 1, 9, 12),
+                    datetime(2026, 1, 13, 12), datetime(2026, 1, 16, 12)]
+
+
+def test_cron_day_and_any_weekday():
+    runs = _next_runs_(Cron("0 12 13 * *"), datetime(2026, 1, 1), 2)
+    assert runs == [datetime(2026, 1, 13, 12), datetime(2026, 2, 13, 12)]
+
+    runs = _next_runs_(Cron("30 9 * * 5"), datetime(2026, 1, 1), 2)
+    assert runs == [datetime(2026, 1, 2, 9, 30), datetime(2026, 1, 9, 9, 30)]
+
+
+def test_cron_sunday_is_0_or_7():
+    # 2026-01-04 is Sunday
+    assert _next_runs_(Cron("0 0 * * 7"), datetime(2026, 1, 1), 1) == [datetime(2026, 1, 4)]
+    assert _next_runs_(Cron("0 0 * * 0"), datetime(2026, 1, 1), 1) == [datetime(2026, 1, 4)]
+